@@ -0,0 +1,577 @@
+"""Offline load test for the backend.
+
+Drives each endpoint at a fixed concurrency and reports throughput and p50/p95/p99 latency.
+By default the app runs in this process with every external service replaced by a local
+stand-in (LLM_PROVIDER, OCR_PROVIDER, MAPS_PROVIDER and CALENDAR_PROVIDER set to "fake"), so
+results are repeatable and need no API keys. With --url it loads a running server instead.
+
+    python benchmark.py --concurrency 16 --requests 200 --corpus ../samples --output before.json
+    python benchmark.py --concurrency 16 --requests 200 --corpus ../samples --compare before.json
+
+A corpus is a directory of prescription images and PDFs. A .txt file with the same stem holds the
+text the fake OCR should return for that image; without one, a sample prescription is used.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".pdf"}
+MEDICATIONS = ["Crocin 650", "Pantocid 40", "Augmentin 625 Duo", "Montair LC", "Dolo 650", "Telma 40", "Metformin 500", "Azithral 500"]
+LANGUAGES = ["Hindi", "Tamil", "Kannada", "Malayalam", "Telugu"]
+
+
+# --- Clients ---
+@dataclass
+class Response:
+    status: int
+    body: bytes
+    ttfb: float  # seconds until the first body chunk (or the headers, over HTTP)
+
+
+class ASGIClient:
+    """Calls the ASGI app directly, so latency is the app's own, without sockets or a server in between."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_in: asyncio.Queue = asyncio.Queue()
+        self._lifespan_out: asyncio.Queue = asyncio.Queue()
+
+    async def _lifespan_event(self, message_type: str):
+        await self._lifespan_in.put({"type": message_type})
+        reply = await self._lifespan_out.get()
+        if reply["type"].endswith(".failed"):
+            raise RuntimeError(f"App {message_type} failed: {reply.get('message')}")
+
+    async def start(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.ensure_future(self.app(scope, self._lifespan_in.get, self._lifespan_out.put))
+        await self._lifespan_event("lifespan.startup")
+
+    async def close(self):
+        if self._lifespan is not None:
+            await self._lifespan_event("lifespan.shutdown")
+            await self._lifespan
+
+    async def request(self, method: str, path: str, body: bytes = b"", content_type: Optional[str] = None) -> Response:
+        path, _, query = path.partition("?")
+        headers = [(b"host", b"benchmark"), (b"content-length", str(len(body)).encode())]
+        if content_type:
+            headers.append((b"content-type", content_type.encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+            "headers": headers, "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+        }
+        sent_body, finished = False, asyncio.Event()
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        started = time.perf_counter()
+        status, chunks, ttfb = 500, [], None
+
+        async def send(message):
+            nonlocal status, ttfb
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finished.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return Response(status, b"".join(chunks), ttfb if ttfb is not None else time.perf_counter() - started)
+
+
+class HTTPClient:
+    """Calls a running server over HTTP from a thread pool."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _request(self, method: str, path: str, body: bytes, content_type: Optional[str]) -> Response:
+        request = urllib.request.Request(self.base_url + path, data=body or None, method=method)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=300) as reply:
+                ttfb = time.perf_counter() - started
+                return Response(reply.status, reply.read(), ttfb)
+        except urllib.error.HTTPError as e:
+            return Response(e.code, e.read(), time.perf_counter() - started)
+
+    async def request(self, method: str, path: str, body: bytes = b"", content_type: Optional[str] = None) -> Response:
+        return await asyncio.to_thread(self._request, method, path, body, content_type)
+
+
+def encode_multipart(files: List[Tuple[str, str, bytes]], fields: Dict[str, str] = None) -> Tuple[bytes, str]:
+    """Encodes (field name, filename, contents) uploads and plain form fields as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, contents in files:
+        content_type = "application/pdf" if filename.lower().endswith(".pdf") else "application/octet-stream"
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n".encode() + contents + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# --- Corpus ---
+@dataclass
+class Corpus:
+    images: List[Tuple[str, bytes]]
+    texts: List[str]
+    cache_busting: bool = False
+
+    def image(self, rng: random.Random) -> Tuple[str, bytes]:
+        filename, contents = rng.choice(self.images)
+        if self.cache_busting:
+            # Image decoders ignore trailing bytes, but the cache keys on all of them.
+            contents = contents + b"\0" + uuid.uuid4().bytes
+        return filename, contents
+
+    def text(self, rng: random.Random) -> str:
+        text = rng.choice(self.texts)
+        return f"{text}\nRef {uuid.uuid4().hex[:8]}" if self.cache_busting else text
+
+
+def synthetic_image(text: str) -> bytes:
+    """Renders text onto a white page, so the same corpus also works with real Tesseract."""
+    import io
+    from PIL import Image, ImageDraw
+
+    lines = text.splitlines()
+    image = Image.new("L", (1200, 120 + 60 * len(lines)), 255)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((60, 60 + 60 * number), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def load_corpus(directory: Optional[str], cache_busting: bool) -> Corpus:
+    from fake_backends import SAMPLE_PRESCRIPTIONS, register_ocr_text
+
+    if directory is None:
+        images = [(f"sample-{number}.png", synthetic_image(text)) for number, text in enumerate(SAMPLE_PRESCRIPTIONS)]
+        for (_, contents), text in zip(images, SAMPLE_PRESCRIPTIONS):
+            register_ocr_text(contents, text)
+        return Corpus(images, list(SAMPLE_PRESCRIPTIONS), cache_busting)
+
+    images, texts = [], []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        contents = path.read_bytes()
+        images.append((path.name, contents))
+        sidecar = path.with_suffix(".txt")
+        if sidecar.exists():
+            text = sidecar.read_text(encoding="utf-8")
+            register_ocr_text(contents, text)
+            texts.append(text)
+    if not images:
+        raise SystemExit(f"No images found in {directory}.")
+    return Corpus(images, texts or list(SAMPLE_PRESCRIPTIONS), cache_busting)
+
+
+# --- Scenarios ---
+def json_body(value) -> Tuple[bytes, str]:
+    return json.dumps(value).encode(), "application/json"
+
+
+def sample_analysis(rng: random.Random) -> dict:
+    return {
+        "medications": [
+            {"name": name, "dosage": "1 tablet", "instruction": "Take after food, twice daily", "duration_days": 5}
+            for name in rng.sample(MEDICATIONS, 3)
+        ],
+        "advice": "Review after 5 days",
+    }
+
+
+def sse_failed(response: Response) -> bool:
+    return b"event: error" in response.body
+
+
+async def analyze(client, rng, corpus):
+    body, content_type = encode_multipart([("file", *corpus.image(rng))])
+    return await client.request("POST", "/analyze", body, content_type)
+
+
+async def analyze_batch(client, rng, corpus):
+    body, content_type = encode_multipart([("files", *corpus.image(rng)) for _ in range(3)])
+    response = await client.request("POST", "/analyze/batch", body, content_type)
+    if response.status == 200 and b'"error"' in response.body:
+        response.status = 207  # some pages failed
+    return response
+
+
+async def jobs(client, rng, corpus):
+    """Enqueues an analysis and polls until it finishes; the latency is the whole round trip."""
+    body, content_type = encode_multipart([("file", *corpus.image(rng))], {"priority": "0"})
+    response = await client.request("POST", "/jobs/analyze", body, content_type)
+    if response.status != 202:
+        return response
+    job_id = json.loads(response.body)["id"]
+    while True:
+        await asyncio.sleep(0.05)
+        polled = await client.request("GET", f"/jobs/{job_id}")
+        job = json.loads(polled.body)
+        if job["status"] in ("done", "failed"):
+            return Response(200 if job["status"] == "done" else 500, polled.body, response.ttfb)
+
+
+async def re_analyze(client, rng, corpus):
+    return await client.request("POST", "/re-analyze", *json_body({"edited_text": corpus.text(rng)}))
+
+
+async def correct(client, rng, corpus):
+    return await client.request("POST", "/correct", *json_body({"text": corpus.text(rng)}))
+
+
+async def summarize(client, rng, corpus):
+    return await client.request("POST", "/summarize", *json_body({"medications": rng.sample(MEDICATIONS, 3)}))
+
+
+async def summarize_stream(client, rng, corpus):
+    response = await client.request("POST", "/summarize/stream", *json_body({"medications": rng.sample(MEDICATIONS, 3)}))
+    if sse_failed(response):
+        response.status = 500
+    return response
+
+
+async def translate(client, rng, corpus):
+    return await client.request("POST", "/translate", *json_body({"content": sample_analysis(rng), "target_language": rng.choice(LANGUAGES)}))
+
+
+def chat_request(rng: random.Random) -> dict:
+    return {
+        "messages": [
+            {"role": "ai", "text": "Hello! How can I help with your prescription?"},
+            {"role": "user", "text": rng.choice(["Can I take these together?", "When should I take the first one?", "What if I miss a dose?"])},
+        ],
+        "analysis_data": sample_analysis(rng),
+    }
+
+
+async def chat(client, rng, corpus):
+    return await client.request("POST", "/chat", *json_body(chat_request(rng)))
+
+
+async def chat_stream(client, rng, corpus):
+    response = await client.request("POST", "/chat/stream", *json_body(chat_request(rng)))
+    if sse_failed(response):
+        response.status = 500
+    return response
+
+
+async def find_pharmacies(client, rng, corpus):
+    location = {"latitude": 12.9 + rng.random() * 0.2, "longitude": 77.5 + rng.random() * 0.2}
+    return await client.request("POST", "/find-pharmacies", *json_body(location))
+
+
+def reminder(rng: random.Random) -> dict:
+    return {"name": rng.choice(MEDICATIONS), "instruction": "1 tablet after food", "time": f"{rng.randint(6, 22):02d}:00", "days_duration": 5}
+
+
+async def set_reminder(client, rng, corpus):
+    return await client.request("POST", "/set-reminder", *json_body({**reminder(rng), "access_token": "benchmark"}))
+
+
+async def set_reminders(client, rng, corpus):
+    response = await client.request("POST", "/set-reminders", *json_body({"reminders": [reminder(rng) for _ in range(4)], "access_token": "benchmark"}))
+    if response.status == 200 and json.loads(response.body)["status"] != "success":
+        response.status = 207
+    return response
+
+
+Scenario = Callable[..., Awaitable[Response]]
+SCENARIOS: Dict[str, Scenario] = {
+    "analyze": analyze,
+    "analyze_batch": analyze_batch,
+    "jobs": jobs,
+    "re_analyze": re_analyze,
+    "correct": correct,
+    "summarize": summarize,
+    "summarize_stream": summarize_stream,
+    "translate": translate,
+    "chat": chat,
+    "chat_stream": chat_stream,
+    "find_pharmacies": find_pharmacies,
+    "set_reminder": set_reminder,
+    "set_reminders": set_reminders,
+}
+
+
+# --- Runner ---
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def summarize_latencies(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50": round(1000 * percentile(values, 0.50), 2),
+        "p95": round(1000 * percentile(values, 0.95), 2),
+        "p99": round(1000 * percentile(values, 0.99), 2),
+        "mean": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+        "max": round(1000 * values[-1], 2) if values else 0.0,
+    }
+
+
+@dataclass
+class EndpointResult:
+    latencies: List[float] = field(default_factory=list)
+    ttfbs: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    wall: float = 0.0
+
+    def to_dict(self) -> dict:
+        completed = len(self.latencies)
+        errors = sum(count for status, count in self.statuses.items() if status == "exception" or int(status) >= 400)
+        return {
+            "requests": completed,
+            "errors": errors,
+            "error_rate": round(errors / completed, 4) if completed else 0.0,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            "throughput_rps": round(completed / self.wall, 2) if self.wall else 0.0,
+            "latency_ms": summarize_latencies(self.latencies),
+            "ttfb_ms": summarize_latencies(self.ttfbs),
+        }
+
+
+async def run_endpoint(client, scenario: Scenario, corpus: Corpus, requests: int, concurrency: int, seed: int) -> EndpointResult:
+    result = EndpointResult()
+    remaining = iter(range(requests))
+
+    async def worker(number: int):
+        rng = random.Random(seed * 1000 + number)
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, rng, corpus)
+                result.statuses[response.status] += 1
+                result.ttfbs.append(response.ttfb)
+            except Exception as e:
+                print(f"WARNING: Request failed: {e!r}")
+                result.statuses["exception"] += 1
+            result.latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    result.wall = time.perf_counter() - started
+    return result
+
+
+def configure_fakes(args):
+    """Points main.py at the local stand-ins; must run before it is imported."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["OCR_PROVIDER"] = "tesseract" if args.real_ocr else "fake"
+    os.environ["MAPS_PROVIDER"] = "fake"
+    os.environ["CALENDAR_PROVIDER"] = "fake"
+    # Fresh, memory-only caches and an empty job queue, so runs don't depend on earlier ones.
+    os.environ["CACHE_DB_PATH"] = ""
+    os.environ["JOB_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="benchmark-")) / "jobs.sqlite3")
+    settings = {
+        "FAKE_LLM_LATENCY_SECONDS": args.llm_latency,
+        "FAKE_LLM_ERROR_RATE": args.llm_error_rate,
+        "FAKE_LLM_RATE_LIMIT_RATE": args.llm_rate_limit_rate,
+        "FAKE_OCR_LATENCY_SECONDS": args.ocr_latency,
+        "FAKE_OCR_ERROR_RATE": args.ocr_error_rate,
+        "FAKE_MAPS_LATENCY_SECONDS": args.maps_latency,
+        "FAKE_MAPS_ERROR_RATE": args.maps_error_rate,
+        "FAKE_CALENDAR_LATENCY_SECONDS": args.calendar_latency,
+        "FAKE_CALENDAR_ERROR_RATE": args.calendar_error_rate,
+    }
+    for name, value in settings.items():
+        if value is not None:
+            os.environ[name] = str(value)
+    return {name: os.environ.get(name) for name in settings} | {
+        name: os.environ[name] for name in ("LLM_PROVIDER", "OCR_PROVIDER", "MAPS_PROVIDER", "CALENDAR_PROVIDER")
+    }
+
+
+def measure_import_time(runs: int) -> dict:
+    """Imports main.py in `runs` fresh interpreters and compares the median with IMPORT_TIME_BUDGET_SECONDS."""
+    env = {**os.environ, "CACHE_DB_PATH": "", "JOB_DB_PATH": str(Path(tempfile.mkdtemp(prefix="benchmark-")) / "jobs.sqlite3")}
+    code = "import json, main; print(json.dumps([main.import_seconds, main.IMPORT_TIME_BUDGET_SECONDS]))"
+    samples, budget = [], None
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=Path(__file__).resolve().parent, env=env).stdout
+        seconds, budget = json.loads(output.strip().splitlines()[-1])
+        samples.append(seconds)
+    median = statistics.median(samples)
+    return {
+        "runs": runs,
+        "median_seconds": round(median, 3),
+        "max_seconds": round(max(samples), 3),
+        "budget_seconds": budget,
+        "within_budget": median <= budget,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, dict]):
+    print(f"\n{'endpoint':<18}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        print(f"{name:<18}{result['requests']:>9}{result['errors']:>8}{result['throughput_rps']:>9}"
+              f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}")
+
+
+def print_comparison(results: Dict[str, dict], baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nCompared with {baseline_path} (commit {(baseline['meta'].get('commit') or 'unknown')[:12]}):")
+    print(f"{'endpoint':<18}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+
+    def change(new: float, old: float) -> str:
+        return f"{100 * (new - old) / old:+.1f}%" if old else "n/a"
+
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        print(f"{name:<18}{change(result['throughput_rps'], old['throughput_rps']):>10}"
+              + "".join(f"{change(result['latency_ms'][p], old['latency_ms'][p]):>10}" for p in ("p50", "p95", "p99")))
+
+
+async def run(args) -> dict:
+    fakes = None
+    if args.url:
+        client = HTTPClient(args.url)
+        # asyncio.to_thread shares the default executor; make it large enough for the requested concurrency.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency + 4))
+    else:
+        fakes = configure_fakes(args)
+        import main as backend
+        client = ASGIClient(backend.app)
+    corpus = load_corpus(args.corpus, args.cache_busting)
+
+    endpoints = args.endpoints.split(",") if args.endpoints else list(SCENARIOS)
+    unknown = [name for name in endpoints if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}. Choose from {', '.join(SCENARIOS)}.")
+
+    results = {}
+    await client.start()
+    try:
+        for name in endpoints:
+            if args.warmup:
+                await run_endpoint(client, SCENARIOS[name], corpus, args.warmup, args.concurrency, args.seed + 1)
+            print(f"Running {name}: {args.requests} requests at concurrency {args.concurrency}...")
+            result = await run_endpoint(client, SCENARIOS[name], corpus, args.requests, args.concurrency, args.seed)
+            results[name] = result.to_dict()
+        stats = await client.request("GET", "/stats")
+        server_stats = json.loads(stats.body) if stats.status == 200 else None
+    finally:
+        await client.close()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or "in-process",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "corpus": args.corpus,
+            "corpus_size": len(corpus.images),
+            "cache_busting": args.cache_busting,
+            "fakes": fakes,
+        },
+        "results": results,
+        "server_stats": server_stats,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the backend with fake or real upstream services.")
+    parser.add_argument("--endpoints", help=f"Comma-separated subset of: {', '.join(SCENARIOS)} (default: all).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once (default 8).")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint (default 100).")
+    parser.add_argument("--warmup", type=int, default=0, help="Unmeasured requests per endpoint before each run.")
+    parser.add_argument("--corpus", help="Directory of prescription images/PDFs, with optional .txt ground truth.")
+    parser.add_argument("--cache-busting", action="store_true", help="Make every upload and text unique, so caches miss.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix (default 1).")
+    parser.add_argument("--url", help="Load a running server (e.g. http://localhost:8000) instead of an in-process app.")
+    parser.add_argument("--real-ocr", action="store_true", help="Use Tesseract instead of the fake OCR (in-process only).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Results JSON from an earlier run to compare against.")
+    parser.add_argument("--import-time", type=int, metavar="RUNS",
+                        help="Only measure how long main.py takes to import, over RUNS fresh interpreters; "
+                             "exits with status 1 if the median is over IMPORT_TIME_BUDGET_SECONDS.")
+    for service in ("llm", "ocr", "maps", "calendar"):
+        parser.add_argument(f"--{service}-latency", type=float, help=f"Mean latency of the fake {service} in seconds.")
+        parser.add_argument(f"--{service}-error-rate", type=float, help=f"Share of fake {service} calls that fail.")
+    parser.add_argument("--llm-rate-limit-rate", type=float, help="Share of fake LLM calls that answer 429.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.import_time:
+        timing = measure_import_time(arguments.import_time)
+        print(f"Import of main.py: median {timing['median_seconds']}s, max {timing['max_seconds']}s "
+              f"over {timing['runs']} runs (budget {timing['budget_seconds']}s).")
+        sys.exit(0 if timing["within_budget"] else 1)
+    report = asyncio.run(run(arguments))
+    print_report(report["results"])
+    if arguments.compare:
+        print_comparison(report["results"], arguments.compare)
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nResults written to {arguments.output}")
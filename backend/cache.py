@@ -0,0 +1,232 @@
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+_MISSING = object()
+
+
+# --- In-Memory Tier ---
+class TTLCache:
+    """A small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# --- Persistent Tier ---
+class SQLiteCache:
+    """A JSON key/value store in SQLite, so cached results survive restarts."""
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        self.path = str(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, version TEXT NOT NULL,"
+            " value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, namespace: str, key: str, version: str = "") -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? AND version = ?",
+                (namespace, key, version),
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, version: str = "", ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, version, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, version, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            self._conn.commit()
+
+    def purge(self, namespace: str, keep_version: str) -> int:
+        """Deletes expired rows and rows written under any other version of `namespace`."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND (version != ? OR expires_at < ?)",
+                (namespace, keep_version, time.time()),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """An in-memory LRU in front of one namespace of a SQLiteCache.
+
+    `ttl` is how long entries live in both tiers (None keeps the SQLiteCache's own default on disk);
+    `memory_ttl`, if given, keeps them in memory for a different time.
+    """
+
+    def __init__(self, namespace: str, version: str, disk: Optional[SQLiteCache],
+                 maxsize: int = 512, ttl: Optional[float] = None, memory_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.version = version
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=memory_ttl or ttl or 3600)
+        self.disk = disk
+        self.disk_hits = 0
+        self.misses = 0
+        if disk is not None:
+            purged = disk.purge(namespace, version)
+            if purged:
+                print(f"Cache '{namespace}': purged {purged} stale entries.")
+
+    def get(self, key: str) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING and self.disk is not None:
+            value = self.disk.get(self.namespace, key, self.version)
+            if value is not _MISSING:
+                self.disk_hits += 1
+                self.memory.set(key, value)
+        if value is _MISSING:
+            self.misses += 1
+            return None
+        # Callers may mutate what they get back; never hand out the cached object itself.
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, copy.deepcopy(value))
+        if self.disk is not None:
+            self.disk.set(self.namespace, key, value, self.version, ttl=self.ttl)
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        lookups = memory["hits"] + self.disk_hits + self.misses
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory["hits"] + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "memory_size": memory["size"],
+            "memory_evictions": memory["evictions"],
+            "disk_size": self.disk.count(self.namespace) if self.disk is not None else 0,
+        }
+
+
+# --- Prescription Analysis Cache ---
+def normalize_text(text: str) -> str:
+    """Normalizes OCR/edited text so trivially different copies share a cache key."""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split()).lower()
+
+
+def sha256_hex(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Two-level cache for /analyze and /re-analyze results.
+
+    The image level is keyed by the uploaded bytes and skips OCR and the LLM; the text level
+    is keyed by the normalized text and skips only the LLM. `version` should change whenever
+    anything that shapes the result changes (prompt template, model), which invalidates both;
+    `ocr_version` does the same for settings that only affect OCR, such as preprocessing.
+    """
+
+    def __init__(self, version: str, disk: Optional[SQLiteCache] = None, ocr_version: str = "",
+                 maxsize: int = 512, memory_ttl: float = 3600):
+        self.version = version
+        self.disk = disk
+        image_version = sha256_hex(version, ocr_version)[:16] if ocr_version else version
+        self.images = TieredCache("analysis_image", image_version, self.disk, maxsize=maxsize, memory_ttl=memory_ttl)
+        self.texts = TieredCache("analysis_text", version, self.disk, maxsize=maxsize, memory_ttl=memory_ttl)
+
+    def get_by_image(self, contents: bytes) -> Optional[dict]:
+        return self.images.get(sha256_hex(contents))
+
+    def set_by_image(self, contents: bytes, result: dict):
+        self.images.set(sha256_hex(contents), result)
+
+    def get_by_text(self, text: str) -> Optional[dict]:
+        return self.texts.get(sha256_hex(normalize_text(text)))
+
+    def set_by_text(self, text: str, result: dict):
+        self.texts.set(sha256_hex(normalize_text(text)), result)
+
+    def stats(self) -> dict:
+        return {"version": self.version, "image": self.images.stats(), "text": self.texts.stats()}
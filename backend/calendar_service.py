@@ -0,0 +1,99 @@
+import json
+import urllib.request
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List
+
+import pytz
+
+from metrics import stage
+
+
+# --- Google Calendar Configuration ---
+TIMEZONE = "Asia/Kolkata"
+CALENDAR_ID = 'primary'
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+# The Calendar API accepts at most 50 calls per batch request.
+MAX_BATCH_SIZE = 50
+# Longer courses are refilled and re-entered anyway; far-off end dates overflow the date arithmetic.
+MAX_REMINDER_DAYS = 3650
+
+@lru_cache(maxsize=1)
+def calendar_discovery_doc() -> dict:
+    """Loads the Calendar v3 discovery document once per process (bundled copy first, network as fallback)."""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = get_static_doc("calendar", "v3")
+        if doc:
+            return json.loads(doc)
+    except ImportError:
+        pass
+    with urllib.request.urlopen(DISCOVERY_URL, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def calendar_service(access_token: str):
+    """Builds a Calendar service for one request.
+
+    Services are never shared: their httplib2 transport is not thread-safe, and requests use them
+    from worker threads. Only the parsed discovery document is cached, which makes building cheap.
+    """
+    # The Google client libraries are imported on first use; they are slow to load.
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build_from_document
+
+    with stage("calendar_build"):
+        return build_from_document(calendar_discovery_doc(), credentials=Credentials(token=access_token))
+
+
+def build_reminder_event(name: str, instruction: str, time: str, days_duration: int) -> dict:
+    """Builds a daily recurring Calendar event body for one medication."""
+    local_tz = pytz.timezone(TIMEZONE)
+    today = datetime.now(local_tz).date()
+    hour, minute = map(int, time.split(':'))
+    start_datetime = local_tz.localize(datetime(today.year, today.month, today.day, hour, minute))
+    end_datetime = start_datetime + timedelta(minutes=30)
+
+    last_dose_date = start_datetime.date() + timedelta(days=days_duration - 1)
+    utc_end_of_day = local_tz.localize(datetime(last_dose_date.year, last_dose_date.month, last_dose_date.day, 23, 59, 59)).astimezone(pytz.utc)
+    until_string = utc_end_of_day.strftime('%Y%m%dT%H%M%SZ')
+    rrule = f'RRULE:FREQ=DAILY;INTERVAL=1;UNTIL={until_string}'
+
+    return {
+        'summary': f"Medication Reminder: Take {name}",
+        'description': f"Dosage/Instruction: {instruction} (Duration: {days_duration} days)",
+        'start': {'dateTime': start_datetime.isoformat(), 'timeZone': TIMEZONE},
+        'end': {'dateTime': end_datetime.isoformat(), 'timeZone': TIMEZONE},
+        'reminders': {'useDefault': False, 'overrides': [{'method': 'popup', 'minutes': 10}]},
+        'recurrence': [rrule]
+    }
+
+
+def insert_event(service, event: dict) -> dict:
+    with stage("calendar_insert"):
+        return service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
+
+
+def insert_events_batch(service, events: List[dict]) -> list:
+    """Inserts events using Calendar batch requests.
+
+    Returns one entry per event, in order: the inserted event, or the exception it failed with.
+    """
+    results = [None] * len(events)
+
+    def on_response(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    for start in range(0, len(events), MAX_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for index in range(start, min(start + MAX_BATCH_SIZE, len(events))):
+            batch.add(service.events().insert(calendarId=CALENDAR_ID, body=events[index]), request_id=str(index))
+        with stage("calendar_batch_insert"):
+            batch.execute()
+    return results
+
+
+def is_auth_error(exception: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    return isinstance(exception, HttpError) and exception.resp.status == 401
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache import TTLCache
+
+
+# --- Chat Context Configuration ---
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "3000"))
+CHAT_KEEP_RECENT_TURNS = int(os.getenv("CHAT_KEEP_RECENT_TURNS", "6"))
+CHAT_SUMMARY_CACHE_SIZE = int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", "1024"))
+CHAT_SUMMARY_TTL_SECONDS = float(os.getenv("CHAT_SUMMARY_TTL_SECONDS", str(6 * 3600)))
+
+MEDICATION_CONTEXT_FIELDS = ("name", "dosage", "instruction", "duration_days")
+
+SUMMARY_PROMPT_TEMPLATE = """
+Summarize this conversation between a patient and a healthcare assistant in at most 120 words.
+Keep every medication name, dose, schedule question, symptom and piece of advice that was mentioned. Write plain prose, no lists.
+
+{previous_summary}Conversation:
+{transcript}
+"""
+
+Turn = Tuple[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Gemini), good enough for budgeting."""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def compact_prescription_context(analysis_data: Optional[Dict[str, Any]]) -> str:
+    """Serializes only the prescription fields the assistant needs, without indentation."""
+    if not analysis_data:
+        return "No prescription data available."
+    compact = {}
+    medications = analysis_data.get("medications")
+    if isinstance(medications, list):
+        compact["medications"] = [
+            {field: med[field] for field in MEDICATION_CONTEXT_FIELDS if med.get(field) not in (None, "", "N/A")}
+            for med in medications if isinstance(med, dict)
+        ]
+    if analysis_data.get("advice") not in (None, "", "N/A"):
+        compact["advice"] = analysis_data["advice"]
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def _turns_hash(turns: List[Turn]) -> str:
+    return hashlib.sha256(json.dumps(turns, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _transcript(turns: List[Turn]) -> str:
+    return "\n".join(f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text in turns)
+
+
+class ChatContextManager:
+    """Keeps /chat prompts within a token budget.
+
+    The most recent turns are sent verbatim; older turns are folded into a rolling
+    summary that is cached per conversation and only extended when more turns fall
+    out of the window.
+    """
+
+    def __init__(self, token_budget: int = CHAT_TOKEN_BUDGET, keep_recent: int = CHAT_KEEP_RECENT_TURNS):
+        self.token_budget = token_budget
+        self.keep_recent = max(1, keep_recent)
+        # conversation id -> (number of folded turns, hash of those turns, summary text)
+        self._summaries = TTLCache(maxsize=CHAT_SUMMARY_CACHE_SIZE, ttl=CHAT_SUMMARY_TTL_SECONDS)
+        self.summaries_built = 0
+        self.summaries_reused = 0
+
+    def _split(self, system_tokens: int, turns: List[Turn]) -> int:
+        """Returns how many of the oldest turns must be folded to fit the budget."""
+        split = max(0, len(turns) - self.keep_recent)
+        used = system_tokens + sum(estimate_tokens(text) for _, text in turns[split:])
+        # Pull older turns back in verbatim while they still fit.
+        while split > 0 and used + estimate_tokens(turns[split - 1][1]) <= self.token_budget:
+            split -= 1
+            used += estimate_tokens(turns[split][1])
+        return split
+
+    async def _summary(self, conversation_id: str, folded: List[Turn],
+                       summarize: Callable[[str], Awaitable[str]]) -> str:
+        cached = self._summaries.get(conversation_id)
+        previous, start = "", 0
+        if cached:
+            count, prefix_hash, summary = cached
+            if count <= len(folded) and prefix_hash == _turns_hash(folded[:count]):
+                if count == len(folded):
+                    self.summaries_reused += 1
+                    return summary
+                previous, start = summary, count
+
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(
+            previous_summary=f"Summary of the earlier part of the conversation:\n{previous}\n\n" if previous else "",
+            transcript=_transcript(folded[start:]),
+        )
+        summary = (await summarize(prompt)).strip()
+        self.summaries_built += 1
+        self._summaries.set(conversation_id, (len(folded), _turns_hash(folded), summary))
+        return summary
+
+    async def build(self, conversation_id: Optional[str], system_prompt: str, turns: List[Turn],
+                    summarize: Callable[[str], Awaitable[str]]) -> Tuple[str, List[Turn], dict]:
+        """Returns the system prompt (with any rolling summary appended), the verbatim turns, and usage numbers."""
+        if not conversation_id:
+            # Without an explicit id, a conversation is identified by its opening turn.
+            conversation_id = _turns_hash(turns[:1])
+
+        system_tokens = estimate_tokens(system_prompt)
+        split = self._split(system_tokens, turns)
+        if split:
+            summary = await self._summary(conversation_id, turns[:split], summarize)
+            system_prompt += f"\n    **Summary of the earlier conversation:**\n    {summary}\n"
+
+        recent = turns[split:]
+        history_tokens = sum(estimate_tokens(text) for _, text in turns)
+        usage = {
+            "estimated_input_tokens": estimate_tokens(system_prompt) + sum(estimate_tokens(text) for _, text in recent),
+            "unbudgeted_input_tokens": system_tokens + history_tokens,
+            "folded_turns": split,
+            "verbatim_turns": len(recent),
+        }
+        return system_prompt, recent, usage
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "keep_recent_turns": self.keep_recent,
+            "summaries_built": self.summaries_built,
+            "summaries_reused": self.summaries_reused,
+            "cached_conversations": len(self._summaries),
+        }
@@ -0,0 +1,165 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache import SQLiteCache, TieredCache, sha256_hex
+
+
+# --- Drug Store Configuration ---
+DRUG_STORE_SIZE = int(os.getenv("DRUG_STORE_SIZE", "5000"))
+DRUG_STORE_TTL_SECONDS = float(os.getenv("DRUG_STORE_TTL_SECONDS", str(30 * 24 * 3600)))
+MAX_HEALTH_TIPS = 5
+
+# Dosage forms and strengths don't change what a drug is for, so they are dropped from the key.
+_FORM_WORDS = {
+    "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules", "syp", "syrup",
+    "inj", "injection", "susp", "suspension", "drop", "drops", "oint", "ointment", "cream", "gel",
+    "mg", "mcg", "g", "ml", "iu",
+}
+_STRENGTH = re.compile(r"^\d+(\.\d+)?(mg|mcg|g|ml|iu|%)?$")
+
+# generate(new drug names, {known drug name: purpose}) -> {"drugs": [...], "summary": "..."}
+Generate = Callable[[List[str], Dict[str, str]], Awaitable[dict]]
+
+
+def normalize_drug_name(name: str) -> str:
+    """'Augmentin 625 Duo Tablet' -> 'augmentin duo'."""
+    name = re.sub(r"\(.*?\)", " ", name.lower())
+    words = re.findall(r"[a-z0-9]+(?:\.\d+)?%?", name)
+    return " ".join(word for word in words if word not in _FORM_WORDS and not _STRENGTH.match(word))
+
+
+def combination_key(medications: List[str]) -> str:
+    """Order-insensitive key for a set of medications."""
+    return sha256_hex(*sorted({normalize_drug_name(name) for name in medications}))
+
+
+@dataclass
+class SummaryParts:
+    """What the store already knows about one medication list, and what is still missing."""
+    names: List[Tuple[str, str]]  # (normalized key, first name given for it)
+    entries: Dict[str, Optional[dict]]
+    combination: str
+    summary: Optional[str]
+
+    @property
+    def unseen(self) -> List[str]:
+        return [name for key, name in self.names if self.entries[key] is None]
+
+    @property
+    def known(self) -> Dict[str, str]:
+        return {name: self.entries[key]["purpose"] for key, name in self.names if self.entries[key] is not None}
+
+    @property
+    def complete(self) -> bool:
+        return not self.unseen and self.summary is not None
+
+
+class DrugInfoStore:
+    """Per-drug purpose, health tips and food interactions, learned once and reused for every /summarize call."""
+
+    def __init__(self, version: str, disk: Optional[SQLiteCache] = None, seed_path: Optional[Path] = None):
+        self.drugs = TieredCache("drug_info", version, disk, maxsize=DRUG_STORE_SIZE, ttl=DRUG_STORE_TTL_SECONDS)
+        self.combinations = TieredCache("drug_combination", version, disk, maxsize=DRUG_STORE_SIZE, ttl=DRUG_STORE_TTL_SECONDS)
+        self.llm_calls = 0
+        self.seeded = 0
+        if seed_path is not None:
+            self.load_seed(seed_path)
+
+    def load_seed(self, path: Path):
+        """Warms the store from a JSON list of {"name", "purpose", "health_tips", "food_interactions"}."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            print(f"WARNING: Drug seed file not found at {path}.")
+            return
+        for entry in entries:
+            names = [entry["name"]] + entry.get("aliases", [])
+            for name in names:
+                self.drugs.set(normalize_drug_name(name), _entry(entry["name"], entry))
+                self.seeded += 1
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.drugs.get(normalize_drug_name(name))
+
+    def lookup(self, medications: List[str]) -> SummaryParts:
+        first_names = {}
+        for name in medications:
+            first_names.setdefault(normalize_drug_name(name), name)
+        combination = combination_key(medications)
+        return SummaryParts(
+            names=list(first_names.items()),
+            entries={key: self.drugs.get(key) for key in first_names},
+            combination=combination,
+            summary=self.combinations.get(combination),
+        )
+
+    def learn_drugs(self, parts: SummaryParts, drugs: List[dict]):
+        """Stores the model's descriptions of the drugs in `parts` that were unseen."""
+        unseen = parts.unseen
+        unseen_keys = {normalize_drug_name(name) for name in unseen}
+        filled = set()
+        for position, item in enumerate(drugs):
+            key = normalize_drug_name(item.get("name", ""))
+            if key not in parts.entries and position < len(unseen):
+                # Fall back to position only if the name matches none of the requested drugs.
+                key = normalize_drug_name(unseen[position])
+            # A drug already in the store keeps its entry, and each new drug is described once.
+            if key in unseen_keys and key not in filled:
+                filled.add(key)
+                parts.entries[key] = _entry(item.get("name") or key, item)
+                self.drugs.set(key, parts.entries[key])
+
+    def learn_summary(self, parts: SummaryParts, summary: str):
+        parts.summary = summary or ""
+        self.combinations.set(parts.combination, parts.summary)
+
+    @staticmethod
+    def sections(parts: SummaryParts) -> dict:
+        """The /summarize answer from what `parts` holds; the summary is "" while still unknown."""
+        health_tips, food_interactions = [], []
+        for key, name in parts.names:
+            entry = parts.entries.get(key)
+            if entry is None:
+                continue
+            for tip in entry["health_tips"]:
+                if tip not in health_tips:
+                    health_tips.append(tip)
+            food_interactions.extend(f"{name}: {interaction}" for interaction in entry["food_interactions"])
+
+        return {
+            "summary": parts.summary or "",
+            "health_tips": health_tips[:MAX_HEALTH_TIPS],
+            "food_interactions": food_interactions,
+        }
+
+    async def summarize(self, medications: List[str], generate: Generate) -> dict:
+        """Assembles a /summarize answer, calling `generate` only for unseen drugs or an unseen combination."""
+        parts = self.lookup(medications)
+        if not parts.complete:
+            self.llm_calls += 1
+            generated = await generate(parts.unseen, parts.known)
+            self.learn_drugs(parts, generated.get("drugs") or [])
+            self.learn_summary(parts, generated.get("summary") or "")
+        return self.sections(parts)
+
+    def stats(self) -> dict:
+        return {
+            "seeded": self.seeded,
+            "llm_calls": self.llm_calls,
+            "drugs": self.drugs.stats(),
+            "combinations": self.combinations.stats(),
+        }
+
+
+def _entry(name: str, item: dict) -> dict:
+    return {
+        "name": name,
+        "purpose": str(item.get("purpose", "")),
+        "health_tips": [str(tip) for tip in item.get("health_tips", [])],
+        "food_interactions": [str(interaction) for interaction in item.get("food_interactions", [])],
+    }
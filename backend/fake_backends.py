@@ -0,0 +1,173 @@
+import hashlib
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from ocr_pool import OCRPool
+
+
+# --- Fake Backend Configuration ---
+# Select them with OCR_PROVIDER=fake, MAPS_PROVIDER=fake and CALENDAR_PROVIDER=fake (see main.py).
+# Latencies are means; each call takes between 0.5x and 1.5x, as for the fake LLM.
+FAKE_OCR_LATENCY_SECONDS = float(os.getenv("FAKE_OCR_LATENCY_SECONDS", "1.5"))
+FAKE_OCR_ERROR_RATE = float(os.getenv("FAKE_OCR_ERROR_RATE", "0"))
+FAKE_MAPS_LATENCY_SECONDS = float(os.getenv("FAKE_MAPS_LATENCY_SECONDS", "0.3"))
+FAKE_MAPS_ERROR_RATE = float(os.getenv("FAKE_MAPS_ERROR_RATE", "0"))
+FAKE_CALENDAR_LATENCY_SECONDS = float(os.getenv("FAKE_CALENDAR_LATENCY_SECONDS", "0.4"))
+FAKE_CALENDAR_ERROR_RATE = float(os.getenv("FAKE_CALENDAR_ERROR_RATE", "0"))
+
+
+class FakeBackendError(Exception):
+    """Mimics a transient upstream failure."""
+    status_code = 503
+
+
+def _simulate(latency: float, error_rate: float, what: str):
+    """Sleeps for a jittered `latency` and fails with probability `error_rate`; runs on worker threads."""
+    time.sleep(random.uniform(0.5, 1.5) * latency)
+    if random.random() < error_rate:
+        raise FakeBackendError(f"503 UNAVAILABLE: the fake {what} backend failed")
+
+
+# --- OCR ---
+# Plausible OCR output: some prescriptions the local rules read on their own, some they leave to the LLM.
+SAMPLE_PRESCRIPTIONS = [
+    "Rx\nTab. Crocin 650 1 tab 1-0-1 after food x 5 days\nTab. Pantocid 40 1 tab 1-0-0 before food x 5 days\nAdvice: Review after 5 days",
+    "Rx\nCap. Amoxyclav 625 1 cap BD after food for 7 days\nSyp. Benadryl 10 ml TDS x 3 days\nAdv: Plenty of fluids",
+    "Rx\nTab Dolo 650 SOS for fever\nTab. Montair LC 1-0-0 at bed time x 10 days",
+    "Dr. A. Kumar MBBS\nRx\nTab. Augmentn 625 Duo 1-0-1 x 5 dys\nTab Vixbiet 1 tab wen required\nReview with reports in 7 days",
+    "Rx\nT. Metformn 500 1-0-1 after meals 30 days\nT. Telma 40 0-0-1\nDiet: low salt, low sugar",
+]
+
+# Texts registered by the benchmark for corpus images, keyed by the image's SHA-256.
+_registered_texts: Dict[str, str] = {}
+
+
+def register_ocr_text(contents: bytes, text: str):
+    """Makes the fake OCR return `text` for this image (e.g. the ground truth next to a corpus image)."""
+    _registered_texts[hashlib.sha256(contents).hexdigest()] = text
+
+
+def _fake_ocr(contents: bytes, timeout: float, config=None, layout_config=None) -> dict:
+    started_at = time.perf_counter()
+    _simulate(min(FAKE_OCR_LATENCY_SECONDS, timeout), FAKE_OCR_ERROR_RATE, "OCR")
+    digest = hashlib.sha256(contents).hexdigest()
+    # The same image always reads the same, so the text cache behaves as it would with Tesseract.
+    text = _registered_texts.get(digest) or SAMPLE_PRESCRIPTIONS[int(digest[:8], 16) % len(SAMPLE_PRESCRIPTIONS)]
+    return {"text": text, "timings_ms": {"tesseract": round(1000 * (time.perf_counter() - started_at), 2)}}
+
+
+def _fake_render_pdf(contents: bytes, dpi: int, max_pages: int) -> list:
+    pages = max(1, contents.count(b"/Type /Page") - contents.count(b"/Type /Pages"))
+    if pages > max_pages:
+        raise ValueError(f"PDF has {pages} pages; at most {max_pages} are allowed.")
+    _simulate(0.05 * pages, 0, "PDF renderer")
+    return [contents + f"page-{number}".encode() for number in range(pages)]
+
+
+class FakeOCRPool(OCRPool):
+    """The real OCR pool (admission queue, 503s, timeouts, stats) with threads that only pretend to run Tesseract."""
+
+    ocr_job = staticmethod(_fake_ocr)
+    render_job = staticmethod(_fake_render_pdf)
+
+    def _make_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fake-ocr")
+
+
+# --- Maps ---
+class FakeMapsClient:
+    """Answers the two googlemaps.Client calls PharmacyFinder makes, with made-up pharmacies."""
+
+    def __init__(self, latency: float = FAKE_MAPS_LATENCY_SECONDS, error_rate: float = FAKE_MAPS_ERROR_RATE):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def places_nearby(self, location, keyword: str = "", rank_by: str = "", **kwargs) -> dict:
+        _simulate(self.latency, self.error_rate, "Maps")
+        latitude, longitude = location
+        return {"results": [
+            {
+                "place_id": f"fake-{latitude:.4f}-{longitude:.4f}-{index}",
+                "name": f"Fake Pharmacy {index + 1}",
+                "vicinity": f"{index + 1} Example Road",
+                "geometry": {"location": {"lat": latitude + 0.001 * index, "lng": longitude - 0.001 * index}},
+            }
+            for index in range(8)
+        ]}
+
+    def place(self, place_id: str, fields: Optional[List[str]] = None, **kwargs) -> dict:
+        _simulate(self.latency, self.error_rate, "Maps")
+        return {"result": {"formatted_phone_number": f"+91 80 {int(hashlib.sha256(place_id.encode()).hexdigest()[:8], 16) % 10 ** 8:08d}"}}
+
+
+# --- Calendar ---
+class _FakeRequest:
+    def __init__(self, service: "FakeCalendarService", body: dict):
+        self.service = service
+        self.body = body
+
+    def execute(self) -> dict:
+        _simulate(self.service.latency, self.service.error_rate, "Calendar")
+        return self.service.created(self.body)
+
+
+class _FakeEvents:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def insert(self, calendarId: str, body: dict) -> _FakeRequest:
+        return _FakeRequest(self.service, body)
+
+
+class _FakeBatch:
+    def __init__(self, service: "FakeCalendarService", callback: Callable):
+        self.service = service
+        self.callback = callback
+        self.requests: List[tuple] = []
+
+    def add(self, request: _FakeRequest, request_id: str):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        # One round trip for the whole batch; each part can still fail on its own.
+        _simulate(self.service.latency, 0, "Calendar")
+        for request_id, request in self.requests:
+            if random.random() < self.service.error_rate:
+                self.callback(request_id, None, FakeBackendError("503 UNAVAILABLE: the fake Calendar backend failed"))
+            else:
+                self.callback(request_id, self.service.created(request.body), None)
+
+
+class FakeCalendarService:
+    """Stands in for the Calendar v3 service object: events().insert(...).execute() and batch requests."""
+
+    def __init__(self, latency: float = FAKE_CALENDAR_LATENCY_SECONDS, error_rate: float = FAKE_CALENDAR_ERROR_RATE):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.inserted = 0
+        self._lock = threading.Lock()
+
+    def created(self, body: dict) -> dict:
+        with self._lock:
+            self.inserted += 1
+        event_id = uuid.uuid4().hex
+        return {**body, "id": event_id, "htmlLink": f"https://calendar.example.com/event?eid={event_id}"}
+
+    def events(self) -> _FakeEvents:
+        return _FakeEvents(self)
+
+    def new_batch_http_request(self, callback: Callable) -> _FakeBatch:
+        return _FakeBatch(self, callback)
+
+
+_calendar = FakeCalendarService()
+
+
+def fake_calendar_service(access_token: str) -> FakeCalendarService:
+    """Same signature as calendar_service.calendar_service; any token is accepted."""
+    return _calendar
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import random
+import re
+from typing import Any, AsyncIterator, Callable, Optional
+
+from chat_context import estimate_tokens
+
+
+# --- Fake Model Configuration ---
+# Select it with LLM_PROVIDER=fake to exercise the gateway and endpoints without Gemini.
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.5"))
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+
+class FakeRateLimitError(Exception):
+    """Mimics Gemini's quota error."""
+    status_code = 429
+
+
+class FakeServerError(Exception):
+    status_code = 503
+
+
+def _prompt_text(prompt: Any) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(str(message.content) for message in prompt)
+
+
+def default_reply(prompt: str) -> str:
+    """A plausible reply for each of the app's prompts, so every endpoint gets a well-formed answer."""
+    count = re.search(r"JSON array of exactly (\d+) strings", prompt)
+    if count:
+        # Translation: echo the input strings back in the same order.
+        match = re.search(r"\[.*\]", prompt.split("STRINGS TO TRANSLATE:")[-1], re.S)
+        return match.group() if match else json.dumps(["translated"] * int(count.group(1)))
+    if '"medications"' in prompt:
+        return json.dumps({
+            "medications": [{"name": "Crocin 650 Tablet", "dosage": "1 tablet",
+                             "instruction": "Take when required", "duration_days": 1}],
+            "advice": "N/A",
+        })
+    if '"drugs"' in prompt:
+        return json.dumps({"drugs": [], "summary": "These medicines are commonly prescribed together."})
+    return "This is a reply from the fake model. Please consult a healthcare professional."
+
+
+class FakeChatModel:
+    """A local stand-in for the chat model with configurable latency and failure rates."""
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY_SECONDS, rate_limit_rate: float = FAKE_LLM_RATE_LIMIT_RATE,
+                 error_rate: float = FAKE_LLM_ERROR_RATE, reply: Optional[Callable[[str], str]] = None):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.reply = reply or default_reply
+
+    async def _respond(self, prompt: Any) -> str:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: quota exceeded (fake model)")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise FakeServerError("503 UNAVAILABLE: the fake model is overloaded")
+        return self.reply(_prompt_text(prompt))
+
+    async def ainvoke(self, prompt: Any, **options):
+        from langchain_core.messages import AIMessage
+
+        text = await self._respond(prompt)
+        input_tokens, output_tokens = estimate_tokens(_prompt_text(prompt)), estimate_tokens(text)
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        })
+
+    async def astream(self, prompt: Any, **options) -> AsyncIterator[Any]:
+        from langchain_core.messages import AIMessageChunk
+
+        text = await self._respond(prompt)
+        for start in range(0, len(text), 16):
+            await asyncio.sleep(0.01)
+            yield AIMessageChunk(content=text[start:start + 16])
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+# --- Job Queue Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))  # 0 means one worker per OCR process
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+# Priorities come from clients, so they are clamped to -JOB_MAX_PRIORITY..JOB_MAX_PRIORITY;
+# otherwise one caller could send a huge value and push everyone else's jobs back.
+JOB_MAX_PRIORITY = int(os.getenv("JOB_MAX_PRIORITY", "10"))
+# A running job belongs to one process for this long and is renewed while it runs; after that
+# any process sharing JOB_DB_PATH may assume its owner died and queue it again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+TERMINAL = {DONE, FAILED}
+
+# handler(payload) -> JSON-serializable result
+Handler = Callable[[bytes], Awaitable[Any]]
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds JOB_QUEUE_MAX unfinished jobs."""
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (e.g. no text in the image)."""
+
+
+class JobQueue:
+    """A durable job queue in SQLite, drained by a fixed number of local async workers.
+
+    Several processes may share one database. Each running job is leased to the process that
+    claimed it, so jobs survive restarts without running twice: a job is only queued again once
+    its owner shut down or its lease ran out. Higher priorities run first, failed jobs are
+    retried with exponential backoff, and watchers are woken on every status change.
+    """
+
+    def __init__(self, path: str, workers: int, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 max_queued: int = JOB_QUEUE_MAX, retention: float = JOB_RETENTION_SECONDS,
+                 lease: float = JOB_LEASE_SECONDS):
+        self.path = str(path)
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.max_queued = max_queued
+        self.retention = retention
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Handler] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL,"
+            " payload BLOB, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL,"
+            " owner TEXT, lease_until REAL)"
+        )
+        # Databases from before leases lack the two columns; their running rows count as expired.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, created_at)")
+        self._conn.commit()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._watchers: Dict[str, asyncio.Event] = {}
+        self._last_prune = 0.0
+        self._last_recovery = 0.0
+        self._lease_task: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.recovered = 0
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    # --- Lifecycle ---
+    def start(self):
+        """Requeues jobs whose owner died and starts the workers; call from the running event loop."""
+        if self._tasks:
+            return
+        self._recover()
+        self._prune()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._lease_task = asyncio.ensure_future(self._renew_leases())
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    async def shutdown(self):
+        tasks = self._tasks + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks, self._lease_task = [], None
+        # Our jobs cut off mid-run go back to the queue at once; other processes' jobs are theirs to finish.
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, updated_at = ? WHERE status = ? AND owner = ?",
+                (QUEUED, time.time(), RUNNING, self.owner))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Producer Side ---
+    def enqueue(self, kind: str, payload: bytes, priority: int = 0) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'.")
+        priority = max(-JOB_MAX_PRIORITY, min(JOB_MAX_PRIORITY, priority))
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+            if pending >= self.max_queued:
+                raise JobQueueFull(f"{pending} jobs are already waiting.")
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, priority, status, payload, created_at, updated_at, available_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, priority, QUEUED, sqlite3.Binary(payload), now, now, now),
+            )
+            self._conn.commit()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, priority, status, result, error, attempts, created_at, updated_at"
+                " FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = {
+                "id": row[0], "kind": row[1], "priority": row[2], "status": row[3],
+                "result": json.loads(row[4]) if row[4] is not None else None,
+                "error": row[5], "attempts": row[6], "created_at": row[7], "updated_at": row[8],
+            }
+            if job["status"] == QUEUED:
+                job["queue_position"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (QUEUED, row[2], row[2], row[7])).fetchone()[0] + 1
+        return job
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[dict]]:
+        """Yields the job each time its status changes, until it finishes; yields None as a heartbeat."""
+        last = None
+        while True:
+            # Register before reading, so a change in between still wakes us.
+            changed = self._watchers.setdefault(job_id, asyncio.Event())
+            job = self.get(job_id)
+            if job is None or job["status"] in TERMINAL:
+                self._watchers.pop(job_id, None)
+            if job is None:
+                return
+            state = (job["status"], job["attempts"])
+            if state != last:
+                last = state
+                yield job
+            if job["status"] in TERMINAL:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def _notify(self, job_id: str):
+        changed = self._watchers.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    # --- Worker Side ---
+    def _claim(self) -> Optional[tuple]:
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs WHERE status = ? AND available_at <= ?"
+                    " ORDER BY priority DESC, created_at LIMIT 1", (QUEUED, now)).fetchone()
+                if row is None:
+                    return None
+                # Another process may have claimed the same row since the SELECT; only one UPDATE can win.
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ? AND status = ?",
+                    (RUNNING, self.owner, now + self.lease, now, row[0], QUEUED))
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    return row[0], row[1], bytes(row[2]), row[3] + 1
+
+    def _recover(self):
+        """Queues again the running jobs whose lease has run out, whoever owned them."""
+        now = time.time()
+        self._last_recovery = now
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, updated_at = ?"
+                " WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)", (QUEUED, now, RUNNING, now))
+            self._conn.commit()
+        self.recovered += cursor.rowcount
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE status = ? AND owner = ?",
+                    (time.time() + self.lease, RUNNING, self.owner))
+                self._conn.commit()
+
+    def _next_retry_in(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(available_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        """Records the outcome; False if the lease was lost and another process now owns the job."""
+        with self._lock:
+            # The image is no longer needed once the job is over.
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, owner = NULL, lease_until = NULL,"
+                " updated_at = ? WHERE id = ? AND owner = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(),
+                 job_id, self.owner))
+            self._conn.commit()
+        return self._kept_lease(job_id, cursor.rowcount)
+
+    def _retry(self, job_id: str, attempts: int, error: str) -> bool:
+        delay = JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, owner = NULL, lease_until = NULL, updated_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (QUEUED, error, time.time() + delay, time.time(), job_id, self.owner))
+            self._conn.commit()
+        return self._kept_lease(job_id, cursor.rowcount)
+
+    @staticmethod
+    def _kept_lease(job_id: str, rowcount: int) -> bool:
+        if rowcount != 1:
+            print(f"WARNING: Lost the lease on job {job_id}; another worker will finish it.")
+        return rowcount == 1
+
+    def _prune(self):
+        self._last_prune = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, time.time() - self.retention))
+            self._conn.commit()
+
+    async def _worker(self):
+        while True:
+            if time.time() - self._last_recovery > self.lease:
+                self._recover()
+            claimed = self._claim()
+            if claimed is None:
+                self._wakeup.clear()
+                retry_in = self._next_retry_in()
+                # Wake at least once a lease, so jobs of a process that died are picked up.
+                timeout = min(60.0, self.lease, retry_in if retry_in is not None else 60.0)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if time.time() - self._last_prune > 3600:
+                    self._prune()
+                continue
+
+            job_id, kind, payload, attempts = claimed
+            self._notify(job_id)
+            try:
+                result = await self._handlers[kind](payload)
+            except asyncio.CancelledError:
+                raise
+            except PermanentJobError as e:
+                self.failed += self._finish(job_id, FAILED, error=str(e))
+            except Exception as e:
+                if attempts < self.max_attempts:
+                    self.retried += self._retry(job_id, attempts, str(e))
+                else:
+                    self.failed += self._finish(job_id, FAILED, error=str(e))
+            else:
+                self.completed += self._finish(job_id, DONE, result=result)
+            self._notify(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "lease_seconds": self.lease,
+            "max_attempts": self.max_attempts,
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "stored_done": counts.get(DONE, 0),
+            "stored_failed": counts.get(FAILED, 0),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "watchers": len(self._watchers),
+        }
@@ -0,0 +1,83 @@
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+LEXICON_DIR = Path(__file__).resolve().parent
+DRUG_LEXICON_PATH = LEXICON_DIR / "drug_lexicon.txt"
+
+
+def load_lexicon(path: Path = DRUG_LEXICON_PATH) -> List[str]:
+    """Reads one term per line; blank lines and lines starting with '#' are skipped."""
+    terms = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            term = line.strip()
+            if term and not term.startswith("#"):
+                terms.append(term)
+    return terms
+
+
+class AhoCorasick:
+    """Finds every lexicon term in a text in a single pass, case-insensitively.
+
+    Terms only match as whole words, except that digits may touch them (OCR often glues strengths on, as in "Augmentin625").
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self.terms: List[str] = []
+        for term in terms:
+            self._add(term)
+        self._build()
+
+    def _add(self, term: str):
+        state = 0
+        for char in term.lower():
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self.terms))
+        self.terms.append(term)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Returns (start, end, term) for each whole-word match, longest first where matches overlap."""
+        lowered = text.lower()
+        matches = []
+        state = 0
+        for index, char in enumerate(lowered):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for term_index in self._output[state]:
+                term = self.terms[term_index]
+                start, end = index - len(term) + 1, index + 1
+                if (start == 0 or not lowered[start - 1].isalpha()) and (end == len(lowered) or not lowered[end].isalpha()):
+                    matches.append((start, end, term))
+
+        # Keep the longest match wherever matches overlap.
+        matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+        selected, last_end = [], -1
+        for match in matches:
+            if match[0] >= last_end:
+                selected.append(match)
+                last_end = match[1]
+        return selected
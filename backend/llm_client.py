@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict
+
+from streaming import chunk_text
+
+
+def _prompt_key(prompt: Any, options: Dict[str, Any]) -> str:
+    """Hashes a prompt string or a list of LangChain messages, plus call options, into a coalescing key."""
+    if isinstance(prompt, str):
+        payload = prompt
+    else:
+        payload = json.dumps([(message.type, message.content) for message in prompt], ensure_ascii=False)
+    if options:
+        payload += json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMClient:
+    """Shared async front for the chat model.
+
+    Identical prompts that are in flight at the same time share one upstream call
+    ("single-flight"), so a burst of equal requests costs a single generation.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.streams = 0
+
+    async def _call(self, prompt: Any, options: Dict[str, Any]):
+        self.calls += 1
+        try:
+            return await self.llm.ainvoke(prompt, **options)
+        except Exception:
+            self.errors += 1
+            raise
+
+    async def ainvoke(self, prompt: Any, **options):
+        """Calls the model; `options` are passed through as generation settings (e.g. response_mime_type)."""
+        key = _prompt_key(prompt, options)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(prompt, options))
+            self._inflight[key] = task
+
+            def _forget(done, key=key):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+            task.add_done_callback(_forget)
+        else:
+            self.coalesced += 1
+        # Shield the shared call so one caller disconnecting doesn't cancel it for the others.
+        return await asyncio.shield(task)
+
+    async def astream(self, prompt: Any, **options) -> AsyncIterator[str]:
+        """Yields the reply text as it is generated. Streams are never coalesced.
+
+        Closing this generator (e.g. when the client disconnects) closes the upstream stream,
+        which cancels the generation.
+        """
+        self.calls += 1
+        self.streams += 1
+        stream = self.llm.astream(prompt, **options)
+        try:
+            async for chunk in stream:
+                yield chunk_text(chunk)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            await stream.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "streams": self.streams,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+        }
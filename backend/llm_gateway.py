@@ -0,0 +1,298 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from chat_context import estimate_tokens
+from metrics import LLM_CALLS, LLM_TOKENS, stage
+
+
+# --- LLM Gateway Configuration ---
+LLM_RPM = float(os.getenv("LLM_RPM", "300"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_INITIAL_CONCURRENCY = float(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+LLM_MIN_CONCURRENCY = float(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = float(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TARGET_LATENCY_SECONDS = float(os.getenv("LLM_TARGET_LATENCY_SECONDS", "15"))
+# Slots batch calls may never take, so a chat message doesn't queue behind a batch of analyses.
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Replies count against the token budget too; this is reserved up front and corrected from usage metadata.
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+
+INTERACTIVE, BATCH = "interactive", "batch"
+LANES = (INTERACTIVE, BATCH)
+
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit")
+_TRANSIENT_MARKERS = ("500", "502", "503", "504", "unavailable", "deadline", "timed out", "timeout", "internal error")
+
+
+def is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or any(marker in f"{type(error).__name__} {error}".lower() for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or is_rate_limited(error):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return any(marker in f"{type(error).__name__} {error}".lower() for marker in _TRANSIENT_MARKERS)
+
+
+def prompt_tokens(prompt: Any) -> int:
+    if isinstance(prompt, str):
+        return estimate_tokens(prompt)
+    return sum(estimate_tokens(message.content if isinstance(message.content, str) else str(message.content))
+               for message in prompt)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` tokens per minute up to `capacity`; the level may go negative to record debt."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (requests larger than the capacity wait for a full bucket)."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate > 0 else 0.0
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMGateway:
+    """Coordinates every call to the chat model.
+
+    - Requests-per-minute and tokens-per-minute token buckets keep us under the provider quota.
+    - The concurrency limit adapts (AIMD): it grows by about one slot per round of fast successes and
+      halves on a 429 or when latency passes the target.
+    - Rate-limited and transient failures are retried with full-jitter exponential backoff.
+    - Interactive calls (chat) are admitted before batch calls (analysis, translation), and batch
+      calls leave LLM_INTERACTIVE_RESERVE slots free.
+
+    It has the same ainvoke/astream interface as the model it wraps, plus a `lane` keyword.
+    Pass `loader` instead of `llm` to build the model on the first call.
+    """
+
+    def __init__(self, llm=None, rpm: float = LLM_RPM, tpm: float = LLM_TPM,
+                 initial_concurrency: float = LLM_INITIAL_CONCURRENCY, min_concurrency: float = LLM_MIN_CONCURRENCY,
+                 max_concurrency: float = LLM_MAX_CONCURRENCY, target_latency: float = LLM_TARGET_LATENCY_SECONDS,
+                 interactive_reserve: int = LLM_INTERACTIVE_RESERVE, max_retries: int = LLM_MAX_RETRIES,
+                 loader: Optional[Callable[[], Any]] = None):
+        self._llm = llm
+        self._loader = loader
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.min_concurrency = max(1.0, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = min(self.max_concurrency, max(self.min_concurrency, initial_concurrency))
+        self.target_latency = target_latency
+        self.interactive_reserve = interactive_reserve
+        self.max_retries = max_retries
+        self._waiting: Dict[str, Deque[Tuple[asyncio.Future, int]]] = {lane: deque() for lane in LANES}
+        self._in_flight: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+        self.calls = {lane: 0 for lane in LANES}
+        self.retries = 0
+        self.rate_limited = 0
+        self.decreases = 0
+        self.total_wait = {lane: 0.0 for lane in LANES}
+        self.total_latency = 0.0
+        self.completed = 0
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = self._loader()
+        return self._llm
+
+    @property
+    def loaded(self) -> bool:
+        return self._llm is not None
+
+    # --- Admission ---
+    def _lane_capacity(self, lane: str) -> int:
+        limit = int(self.limit)
+        if lane == BATCH:
+            return max(1, limit - self.interactive_reserve)
+        return limit
+
+    def _dispatch(self):
+        """Admits waiting calls in lane priority order while concurrency and both buckets allow."""
+        self._timer = None
+        for lane in LANES:
+            queue = self._waiting[lane]
+            while queue and queue[0][0].done():
+                queue.popleft()  # cancelled while waiting
+            while queue:
+                if sum(self._in_flight.values()) >= int(self.limit) or self._in_flight[lane] >= self._lane_capacity(lane):
+                    break
+                future, tokens = queue[0]
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait > 0:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                    return
+                queue.popleft()
+                if future.done():
+                    continue
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self._in_flight[lane] += 1
+                future.set_result(None)
+            if queue:
+                # Lower lanes never overtake a higher lane that is still waiting.
+                return
+
+    async def _acquire(self, lane: str, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[lane].append((future, tokens))
+        started = time.monotonic()
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(lane)  # admitted just as we were cancelled
+            raise
+        self.total_wait[lane] += time.monotonic() - started
+
+    def _release(self, lane: str):
+        self._in_flight[lane] -= 1
+        if self._timer is None:
+            self._dispatch()
+
+    # --- AIMD ---
+    def _on_success(self, latency: float):
+        self.completed += 1
+        self.total_latency += latency
+        if latency > self.target_latency:
+            self._decrease()
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def _decrease(self):
+        # Many calls fail together when quota runs out; halve once per latency window, not once per call.
+        now = time.monotonic()
+        if now - self._last_decrease < min(self.target_latency, 5.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        self.decreases += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    def _record_usage(self, usage: Optional[dict], reserved: int, lane: str):
+        usage = usage or {}
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), lane=lane, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), lane=lane, direction="output")
+        actual = usage.get("total_tokens")
+        if actual is not None:
+            self.tokens.give(reserved - actual)
+
+    def _record_failure(self, error: Exception, lane: str):
+        rate_limited = is_rate_limited(error)
+        LLM_CALLS.inc(lane=lane, outcome="rate_limited" if rate_limited else "error")
+        if rate_limited:
+            self.rate_limited += 1
+            self._decrease()
+
+    # --- Model Interface ---
+    async def ainvoke(self, prompt: Any, lane: str = BATCH, **options):
+        reserved = prompt_tokens(prompt) + LLM_EXPECTED_OUTPUT_TOKENS
+        self.calls[lane] += 1
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, reserved)
+            started = time.monotonic()
+            try:
+                with stage("llm_invoke"):
+                    response = await self.llm.ainvoke(prompt, **options)
+            except Exception as e:
+                self._record_failure(e, lane)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                print(f"WARNING: LLM call failed ({e}); retrying, attempt {attempt + 2} of {self.max_retries + 1}.")
+            else:
+                LLM_CALLS.inc(lane=lane, outcome="success")
+                self._on_success(time.monotonic() - started)
+                self._record_usage(getattr(response, "usage_metadata", None), reserved, lane)
+                return response
+            finally:
+                self._release(lane)
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def astream(self, prompt: Any, lane: str = INTERACTIVE, **options) -> AsyncIterator[Any]:
+        """Streams chunks; retries only before the first chunk, since text already sent can't be taken back."""
+        reserved = prompt_tokens(prompt) + LLM_EXPECTED_OUTPUT_TOKENS
+        self.calls[lane] += 1
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, reserved)
+            started = time.monotonic()
+            stream = self.llm.astream(prompt, **options)
+            yielded = False
+            usage: Dict[str, int] = {}
+            try:
+                with stage("llm_stream"):
+                    async for chunk in stream:
+                        yielded = True
+                        # Streamed chunks carry usage deltas; their sum is the usage of the whole reply.
+                        for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                            if isinstance(value, int):
+                                usage[key] = usage.get(key, 0) + value
+                        yield chunk
+            except Exception as e:
+                self._record_failure(e, lane)
+                if yielded or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+            else:
+                LLM_CALLS.inc(lane=lane, outcome="success")
+                self._on_success(time.monotonic() - started)
+                self._record_usage(usage or None, reserved, lane)
+                return
+            finally:
+                await stream.aclose()
+                self._release(lane)
+            await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": dict(self._in_flight),
+            "waiting": {lane: len(queue) for lane, queue in self._waiting.items()},
+            "calls": dict(self.calls),
+            "avg_wait_ms": {
+                lane: round(1000 * self.total_wait[lane] / self.calls[lane], 1) if self.calls[lane] else 0.0
+                for lane in LANES
+            },
+            "avg_latency_ms": round(1000 * self.total_latency / self.completed, 1) if self.completed else 0.0,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "decreases": self.decreases,
+            "rpm_available": round(self.requests.level, 1),
+            "tpm_available": round(self.tokens.level),
+        }
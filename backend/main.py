@@ -1,32 +1,42 @@
-import pytesseract
-from PIL import Image
+import time
+_import_started = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
 import json
-from langchain_google_genai import ChatGoogleGenerativeAI
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+import asyncio
+import contextlib
+from functools import lru_cache
+from fastapi import APIRouter, FastAPI, File, Form, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-import io
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
-# --- LangChain Message Imports ---
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-
-# --- Google Calendar & Maps API Imports ---
-import os.path
-from google.auth.transport.requests import Request as GoogleRequest
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow 
-from googleapiclient.discovery import build
-from datetime import datetime, timedelta
-import pytz
-import googlemaps
-# -----------------------------------
+# LangChain, Gemini and the Google API clients are imported where they are first used, not here:
+# they take most of a second to load, and a worker that only serves /auth/* never needs Gemini.
+
 # --- Pathlib import for robust pathing ---
 from pathlib import Path
 
+from ocr_pool import OCRPool, OCRQueueFull, OCRTimeout, OCRWorkerCrashed
+from cache import AnalysisCache, SQLiteCache, sha256_hex
+from llm_client import LLMClient
+from llm_gateway import INTERACTIVE, LLMGateway
+from fake_llm import FakeChatModel
+from fake_backends import FakeMapsClient, FakeOCRPool, fake_calendar_service
+from streaming import JSONSectionParser, sse_event
+from chat_context import ChatContextManager, compact_prescription_context
+from translation_memory import TranslationMemory
+from drug_store import DrugInfoStore, normalize_drug_name
+from rule_extractor import RULES_VERSION, RuleExtractor
+from spelling import SpellingCorrector
+from structured_output import Analysis, DrugInfoBatch, StructuredOutput, StructuredOutputError, Translation, supports_json_mode
+from job_queue import JOB_WORKERS, JobQueue, JobQueueFull, PermanentJobError
+from pharmacies import PharmacyFinder
+from calendar_service import MAX_REMINDER_DAYS, build_reminder_event, calendar_discovery_doc, calendar_service, insert_event, insert_events_batch, is_auth_error
+from metrics import InstrumentationMiddleware, profiler, registry, stage
+
 
 # --- Setup ---
 backend_dir = Path(__file__).resolve().parent
@@ -39,18 +49,20 @@ else:
     print(f"WARNING: Environment file not found at {dotenv_path}. Make sure it exists.")
 
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
 api_key = os.getenv("GOOGLE_API_KEY")
 maps_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
 
-
-if not api_key or not maps_api_key:
-    raise ValueError("ERROR: GOOGLE_API_KEY or GOOGLE_MAPS_API_KEY is not set. Please check your .env.local file.")
+# --- Providers ---
+# Each external service can be swapped for a local stand-in with simulated latency and errors
+# (fake_llm.py, fake_backends.py); benchmark.py runs the whole app offline this way.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+OCR_PROVIDER = os.getenv("OCR_PROVIDER", "tesseract")
+MAPS_PROVIDER = os.getenv("MAPS_PROVIDER", "google")
+CALENDAR_PROVIDER = os.getenv("CALENDAR_PROVIDER", "google")
 
 
 # --- Google Calendar Configuration ---
-TIMEZONE = "Asia/Kolkata"
-CALENDAR_ID = 'primary'
 SCOPES = [
     "https://www.googleapis.com/auth/calendar.events",
     "https://www.googleapis.com/auth/userinfo.email",
@@ -58,28 +70,60 @@ SCOPES = [
     "openid",
 ]
 
-# --- LangChain Model Initialization ---
-llm = ChatGoogleGenerativeAI( model="gemini-2.5-flash", temperature=0, google_api_key=api_key )
-
-# --- FastAPI App Initialization ---
-app = FastAPI()
-origins = [ "http://localhost:3000" ]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+OAUTH_CREDENTIALS_PATH = Path(os.getenv("OAUTH_CREDENTIALS_PATH", str(backend_dir / "credentials.json")))
+
+
+class MissingConfiguration(RuntimeError):
+    """Raised when a client is first needed but its API key is not set."""
+
+
+# --- Lazily Initialized Clients ---
+# Each client is built on first use and then kept for the life of the process. The module
+# imports without any secrets; a missing key only fails the requests that need it.
+MODEL_NAME = "gemini-2.5-flash"
+
+@lru_cache(maxsize=1)
+def get_llm():
+    if LLM_PROVIDER == "fake":
+        return FakeChatModel()
+    if not api_key:
+        raise MissingConfiguration("GOOGLE_API_KEY is not set. Please check your .env.local file.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI( model=MODEL_NAME, temperature=0, google_api_key=api_key )
+
+
+@lru_cache(maxsize=1)
+def oauth_client_config() -> dict:
+    """The OAuth client configuration from credentials.json, read once per process."""
+    with open(OAUTH_CREDENTIALS_PATH, 'r') as f:
+        return json.load(f)
+
 
+# Every call goes through the gateway: rate limits, adaptive concurrency, retries and priority lanes.
+llm_gateway = LLMGateway(loader=get_llm)
+llm_client = LLMClient(llm_gateway)
+structured_output = StructuredOutput(llm_client, json_mode=lambda: supports_json_mode(llm_gateway.llm))
+
+router = APIRouter()
+
+# --- OCR Process Pool ---
+ocr_pool = FakeOCRPool() if OCR_PROVIDER == "fake" else OCRPool(tesseract_cmd=TESSERACT_CMD)
+ANALYZE_BATCH_MAX_PAGES = int(os.getenv("ANALYZE_BATCH_MAX_PAGES", "20"))
+
+
+# Disable proxy buffering so streamed events reach the browser as they are produced.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 # --- Pydantic Models ---
 class MedicationList(BaseModel): medications: List[str]
 class ReminderRequest(BaseModel): name: str; instruction: str; time: str; days_duration: int; access_token: str
-class TranslationRequest(BaseModel): content: Dict[str, Any]; target_language: str
-class ChatRequest(BaseModel): messages: List[Dict[str, str]]; analysis_data: Optional[Dict[str, Any]] = None
+class ReminderItem(BaseModel): name: str; instruction: str; time: str; days_duration: int
+class BatchReminderRequest(BaseModel): reminders: List[ReminderItem]; access_token: str
+class TranslationRequest(BaseModel): content: Dict[str, Any]; target_language: Optional[str] = None; target_languages: Optional[List[str]] = None
+class ChatRequest(BaseModel): messages: List[Dict[str, str]]; analysis_data: Optional[Dict[str, Any]] = None; conversation_id: Optional[str] = None
 class LocationRequest(BaseModel): latitude: float; longitude: float
 class ReanalysisRequest(BaseModel): edited_text: str
+class CorrectionRequest(BaseModel): text: str
 class RefreshTokenRequest(BaseModel): refresh_token: str
 
 # --- Analysis Prompt ---
@@ -100,6 +144,7 @@ You are an expert medical data analysis AI. Your task is to analyze the followin
 2.  **For Unreadable Text:** If a piece of text is so garbled that you cannot confidently correct it into a real-world medicine or a coherent instruction, you MUST use the string "Illegible".
 3.  **DO NOT HALLUCINATE:** Never invent a medicine name or dosage. If the OCR text for a medicine is nonsensical (e.g., 'Vixbiet'), label its name as "Illegible" and do not attempt to create a dosage for it.
 4.  **Duration (Days):** Find the total number of days the medication is prescribed for. Look for explicit terms like "for 7 days," "x 14 days," or "till 30 days" in the text associated with the medicine. If found, provide the number as an **INTEGER**. If not found or illegible, use the INTEGER **1** (assuming a minimum duration).
+5.  **OCR Markers:** A word written as [?word] was read with low confidence, and " | " separates the columns of one table row. Be strict with a medicine whose name is only low-confidence words: use "Illegible" unless it is clearly a real medicine.
     
 Format your final response as a single JSON object with two keys: "medications" and "advice".
 - The "medications" key should hold a list of JSON objects, each with **FOUR** keys: "name", "dosage", "instruction", AND **"duration_days"** (as an integer).
@@ -132,46 +177,287 @@ Here is the text to analyze:
 ---
 """
 
+# --- Translation Prompt ---
+TRANSLATION_PROMPT_TEMPLATE = """
+You are a highly skilled translation AI. Translate each string in the JSON array below into {target_language}.
+
+**CRITICAL INSTRUCTIONS:**
+1.  Return ONLY a JSON array of exactly {count} strings, in the same order as the input. Do not wrap it in ```json``` or add any conversational text.
+2.  Keep specific medical terms and drug names as they are.
+3.  Numbers should not be translated or changed.
+4.  Use the native script for the target language (e.g., Devanagari for Hindi).
+
+**STRINGS TO TRANSLATE:**
+{strings_json}
+"""
+
+# --- Medication Information Prompt ---
+DRUG_INFO_PROMPT_TEMPLATE = """
+You are a helpful AI medical assistant. Provide clear, concise, and easy-to-understand information about medications for a patient.
+
+**New Medications:** {new_drugs}
+**Already Described Medications:** {known_drugs}
+
+**Instructions:**
+1.  For EACH new medication, give its primary purpose in one sentence, 1-3 general health tips for someone taking it, and its potential food or drink interactions (if there are no well-known major interactions, state that).
+2.  Write a brief, one-paragraph summary explaining the primary purpose of the whole combination (new and already described medications together).
+
+**CRITICAL OUTPUT FORMAT:**
+- Your entire response MUST be a single, valid JSON object with two keys: "drugs" and "summary".
+- "drugs" is a list with one object per new medication, in the same order, each with the keys "name" (exactly as given), "purpose" (string), "health_tips" (list of strings) and "food_interactions" (list of strings).
+- "summary" is the combination paragraph as a single string.
+"""
+
+# --- Persistent Cache ---
+# One SQLite file backs every persistent cache; set CACHE_DB_PATH to an empty string to keep caches in memory only.
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", str(backend_dir / "cache.sqlite3"))
+cache_db = SQLiteCache(CACHE_DB_PATH, ttl=float(os.getenv("CACHE_DB_TTL_SECONDS", str(7 * 24 * 3600)))) if CACHE_DB_PATH else None
+
+# --- OCR Spelling Correction ---
+spelling_corrector = SpellingCorrector.load()
+
+# --- Local Rule-Based Extraction ---
+rule_extractor = RuleExtractor()
+
+# --- Analysis Cache ---
+# Keys include a hash of the prompt template, model, output schema and extraction rules, so changing any of them invalidates old results.
+analysis_cache = AnalysisCache(
+    version=sha256_hex(ANALYSIS_PROMPT_TEMPLATE, MODEL_NAME, json.dumps(Analysis.model_json_schema(), sort_keys=True),
+                       RULES_VERSION, rule_extractor.threshold)[:16],
+    ocr_version=json.dumps({
+        "preprocess": ocr_pool.preprocess_config.to_dict(),
+        "layout": ocr_pool.layout_config.to_dict(),
+        "spelling": spelling_corrector.version,
+    }, sort_keys=True),
+    disk=cache_db,
+    maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "512")),
+    memory_ttl=float(os.getenv("ANALYSIS_CACHE_MEMORY_TTL_SECONDS", "3600")),
+)
+
+# --- Translation Memory ---
+translation_memory = TranslationMemory(version=sha256_hex(TRANSLATION_PROMPT_TEMPLATE, MODEL_NAME)[:16], disk=cache_db)
+
+# --- Medication Information Store ---
+drug_store = DrugInfoStore(
+    version=sha256_hex(DRUG_INFO_PROMPT_TEMPLATE, MODEL_NAME)[:16],
+    disk=cache_db,
+    seed_path=Path(os.getenv("DRUG_SEED_PATH", str(backend_dir / "drug_seed.json"))),
+)
+
+# --- Pharmacy Lookup ---
+pharmacy_finder = PharmacyFinder(maps_api_key, client=FakeMapsClient() if MAPS_PROVIDER == "fake" else None)
+
+# --- Calendar Service ---
+get_calendar_service = fake_calendar_service if CALENDAR_PROVIDER == "fake" else calendar_service
+
+# --- Chat Context ---
+chat_context = ChatContextManager()
+
+# --- Analysis Job Queue ---
+# Jobs are kept in their own SQLite file, since queued work must survive restarts even when caches are memory-only.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", str(backend_dir / "jobs.sqlite3"))
+job_queue = JobQueue(JOB_DB_PATH, workers=JOB_WORKERS or ocr_pool.workers)
+
 # --- Core Logic ---
-def get_analysis_from_text(text: str):
-    prompt = ANALYSIS_PROMPT_TEMPLATE.format(text_to_analyze=text)
-    cleaned_response = ""
+async def get_analysis_from_text(text: str):
+    with stage("cache_text"):
+        cached = analysis_cache.get_by_text(text)
+    if cached is not None:
+        return cached
+
+    with stage("rule_extract"):
+        extraction = rule_extractor.extract(text)
+    confident_medications = extraction.confident_medications()
+    if extraction.is_confident():
+        rule_extractor.local += 1
+        data = extraction.to_analysis()
+    elif confident_medications and extraction.uncertain_lines:
+        # Keep what the rules read confidently and send only the uncertain lines to the model.
+        rule_extractor.partial += 1
+        llm_data = await analyze_text_with_llm("\n".join(extraction.uncertain_lines))
+        advice = extraction.advice if extraction.advice_confidence >= rule_extractor.threshold else "N/A"
+        data = merge_analyses([{"medications": confident_medications, "advice": advice}, llm_data])
+    else:
+        rule_extractor.llm_only += 1
+        data = await analyze_text_with_llm(text)
+
+    analysis_cache.set_by_text(text, data)
+    return data
+
+
+async def analyze_text_with_llm(text: str) -> dict:
+    with stage("prompt_format"):
+        prompt = ANALYSIS_PROMPT_TEMPLATE.format(text_to_analyze=text)
     try:
-        response = llm.invoke(prompt)
-        cleaned_response = response.content.strip().replace("```json", "").replace("```", "")
-        if not cleaned_response: raise ValueError("LLM returned empty analysis.")
-        
-        data = json.loads(cleaned_response)
-        if not isinstance(data.get("medications"), list):
-                raise KeyError("JSON missing 'medications' list.")
-                
-        for med in data["medications"]:
-            if "duration_days" not in med:
-                print("WARNING: Missing 'duration_days' key in a medication object.")
-                
-        return data
-
-    except json.JSONDecodeError as e:
+        analysis = await structured_output.generate("analysis", prompt, Analysis)
+        return analysis.model_dump()
+
+    except StructuredOutputError as e:
         print(f"--- JSON DECODE ERROR ---")
         print(f"Error: {e}")
-        print(f"AI response that failed to parse:\n{cleaned_response}")
         print(f"-------------------------")
         raise HTTPException(status_code=500, detail="Could not get a valid analysis from the AI model (JSON format error).")
+    except MissingConfiguration:
+        raise
     except Exception as e:
         print(f"Error during AI analysis: {e}")
         raise HTTPException(status_code=500, detail="Could not get a valid analysis from the AI model.")
 
 
+async def translate_strings(strings: List[str], target_language: str) -> List[str]:
+    """Translates a batch of strings with one LLM call; the reply must be a JSON array in the same order."""
+    with stage("prompt_format"):
+        prompt = TRANSLATION_PROMPT_TEMPLATE.format(
+            target_language=target_language,
+            count=len(strings),
+            strings_json=json.dumps(strings, ensure_ascii=False),
+        )
+
+    def check_count(translation: Translation):
+        if len(translation.root) != len(strings):
+            raise ValueError(f"Expected a JSON array of {len(strings)} strings, got {len(translation.root)}.")
+
+    translated = await structured_output.generate("translation", prompt, Translation, check=check_count)
+    return translated.root
+
+
+async def analyze_image(contents: bytes, ocr_slots: Optional[asyncio.Semaphore] = None) -> dict:
+    """Runs the full image pipeline (image cache, OCR, analysis) and raises HTTPException on failure.
+
+    `ocr_slots` optionally limits how many OCR jobs the caller has in flight; it is released before the LLM call.
+    """
+    with stage("cache_image"):
+        cached = analysis_cache.get_by_image(contents)
+    if cached is not None:
+        return cached
+
+    try:
+        async with ocr_slots or contextlib.nullcontext():
+            with stage("ocr"):
+                ocr_result = await ocr_pool.ocr(contents)
+    except OCRQueueFull as e:
+        raise HTTPException(status_code=503, detail="OCR service is busy. Please try again shortly.", headers={"Retry-After": str(e.retry_after)})
+    except OCRTimeout:
+        raise HTTPException(status_code=504, detail="OCR timed out while reading the image.")
+    except OCRWorkerCrashed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+
+    extracted_text = ocr_result["text"]
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail="OCR failed: No text could be extracted.")
+    with stage("spelling"):
+        extracted_text, _ = spelling_corrector.correct(extracted_text)
+    data = await get_analysis_from_text(extracted_text)
+    analysis_cache.set_by_image(contents, data)
+    return data
+
+
+async def run_analysis_job(contents: bytes) -> dict:
+    try:
+        return await analyze_image(contents)
+    except HTTPException as e:
+        # Client errors (e.g. no readable text) fail the job; busy or failed upstreams are retried.
+        if e.status_code < 500:
+            raise PermanentJobError(e.detail)
+        raise RuntimeError(e.detail)
+
+job_queue.register("analyze", run_analysis_job)
+
+
+def is_pdf(file: UploadFile, contents: bytes) -> bool:
+    return file.content_type == "application/pdf" or contents[:5] == b"%PDF-"
+
+
+def _medication_quality(med: dict) -> int:
+    return sum(1 for value in med.values() if value not in ("N/A", "Illegible", None, ""))
+
+
+def merge_analyses(analyses: List[dict]) -> dict:
+    """Merges per-page analyses; a medication listed on several pages is kept once, in its most complete form."""
+    merged, advice = {}, []
+    for data in analyses:
+        for med in data.get("medications", []):
+            key = normalize_drug_name(str(med.get("name", "")))
+            if not key or med.get("name") == "Illegible":
+                key = f"illegible-{len(merged)}"
+            current = merged.get(key)
+            if current is None or _medication_quality(med) > _medication_quality(current):
+                merged[key] = med
+        page_advice = data.get("advice")
+        if page_advice and page_advice not in ("N/A", "Illegible") and page_advice not in advice:
+            advice.append(page_advice)
+    return {"medications": list(merged.values()), "advice": " ".join(advice) if advice else "N/A"}
+
+
+def build_drug_info_prompt(new_drugs: List[str], known_drugs: Dict[str, str]) -> str:
+    with stage("prompt_format"):
+        return DRUG_INFO_PROMPT_TEMPLATE.format(
+            new_drugs=", ".join(new_drugs) or "None",
+            known_drugs="; ".join(f"{name} ({purpose})" for name, purpose in known_drugs.items()) or "None",
+        )
+
+
+async def generate_drug_info(new_drugs: List[str], known_drugs: Dict[str, str]) -> dict:
+    """Asks the LLM about unseen medications and for the combination summary, in one call."""
+    generated = await structured_output.generate("drug_info", build_drug_info_prompt(new_drugs, known_drugs), DrugInfoBatch)
+    return generated.model_dump()
+
+
+async def summarize_conversation(prompt: str) -> str:
+    response = await llm_client.ainvoke(prompt, lane=INTERACTIVE)
+    return response.content
+
+
+async def build_chat_messages(request: ChatRequest):
+    """Builds the LangChain messages for a chat turn within the context token budget; also returns usage numbers."""
+    context_str = "No prescription data available."
+    if request.analysis_data:
+        context_str = f"The user's current prescription analysis is:\n{compact_prescription_context(request.analysis_data)}"
+
+    system_prompt = f"""
+    You are an AI Healthcare Planning Agent. Your primary role is to assist users with questions about their medication schedule and general health inquiries based on their prescription.
+
+    **Your Core Traits:**
+    - **Proactive:** You anticipate user needs.
+    - **Reasoning:** You understand interactions, risks, and schedules based on the provided context.
+    - **Personalized:** Your advice is tailored to the user's specific prescription data.
+    - **Autonomous:** You can provide clear next steps and suggestions without needing manual intervention for simple queries.
+    - **Explainable:** You provide the reasoning for your advice.
+
+    **IMPORTANT SAFETY RULE:** You are an AI assistant, NOT a doctor. You MUST ALWAYS include a disclaimer to consult a healthcare professional for any medical decisions. Never give definitive medical advice. You can provide information and suggestions based ONLY on the data provided.
+
+    **User's Prescription Context:**
+    {context_str}
+
+    Now, please continue the conversation with the user.
+    """
+    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+
+    turns = [(msg["role"], msg["text"]) for msg in request.messages[1:] if msg["role"] in ('user', 'ai')]
+    with stage("chat_context"):
+        system_prompt, turns, usage = await chat_context.build(request.conversation_id, system_prompt, turns, summarize_conversation)
+
+    langchain_messages = [SystemMessage(content=system_prompt)]
+    for role, text in turns:
+        if role == 'user': langchain_messages.append(HumanMessage(content=text))
+        elif role == 'ai': langchain_messages.append(AIMessage(content=text))
+    return langchain_messages, usage
+
+
 # --- OAUTH 2.0 AUTHENTICATION FLOW ---
 
-@app.get("/auth/login")
+@router.get("/auth/login")
 def login_with_google():
     """Redirects the user to Google's login page using credentials.json."""
+    from google_auth_oauthlib.flow import Flow
+
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
     
     try:
-        flow = Flow.from_client_secrets_file(
-            'credentials.json',
+        flow = Flow.from_client_config(
+            oauth_client_config(),
             scopes=SCOPES,
             redirect_uri="http://localhost:8000/auth/callback"
         )
@@ -185,14 +471,17 @@ def login_with_google():
     return RedirectResponse(authorization_url)
 
 
-@app.get("/auth/callback")
+@router.get("/auth/callback")
 def auth_callback(request: Request):
     """Handles the redirect from Google after user login."""
+    from google_auth_oauthlib.flow import Flow
+    from googleapiclient.discovery import build
+
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
     
     try:
-        flow = Flow.from_client_secrets_file(
-            'credentials.json',
+        flow = Flow.from_client_config(
+            oauth_client_config(),
             scopes=SCOPES,
             redirect_uri="http://localhost:8000/auth/callback",
         )
@@ -214,12 +503,14 @@ def auth_callback(request: Request):
         print(f"Error in auth callback: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred during authentication callback: {str(e)}")
 
-@app.post("/auth/refresh")
+@router.post("/auth/refresh")
 def refresh_token(request: RefreshTokenRequest):
     """Refreshes an expired access token using a refresh token."""
+    from google.auth.transport.requests import Request as GoogleRequest
+    from google.oauth2.credentials import Credentials
+
     try:
-        with open('credentials.json', 'r') as f:
-            client_secrets_config = json.load(f)["web"]
+        client_secrets_config = oauth_client_config()["web"]
 
         creds = Credentials(
             None,
@@ -238,87 +529,227 @@ def refresh_token(request: RefreshTokenRequest):
         raise HTTPException(status_code=401, detail="Could not refresh token. Please log in again.")
 
 # --- API Endpoints ---
-@app.post("/analyze")
+@router.post("/analyze")
 async def analyze_endpoint(file: UploadFile = File(...)):
-    contents = await file.read()
+    with stage("upload_read"):
+        contents = await file.read()
+    return await analyze_image(contents)
+
+@router.post("/analyze/batch")
+async def analyze_batch_endpoint(files: List[UploadFile] = File(...)):
+    """Analyzes several images and/or multi-page PDFs, streaming one NDJSON line per page as it finishes.
+
+    Pages are OCR'd concurrently and each page's LLM extraction starts as soon as its OCR is done.
+    The last line merges the medications of all pages, without duplicates.
+    """
+    pages = []
+    for file in files:
+        with stage("upload_read"):
+            contents = await file.read()
+        if is_pdf(file, contents):
+            try:
+                with stage("pdf_render"):
+                    rendered = await ocr_pool.render_pdf(contents, ANALYZE_BATCH_MAX_PAGES)
+            except ImportError:
+                raise HTTPException(status_code=415, detail="PDF support is not installed on the server (pymupdf).")
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except OCRQueueFull as e:
+                raise HTTPException(status_code=503, detail="OCR service is busy. Please try again shortly.", headers={"Retry-After": str(e.retry_after)})
+            except OCRTimeout:
+                raise HTTPException(status_code=504, detail="Timed out while rendering the PDF.")
+            except OCRWorkerCrashed:
+                raise HTTPException(status_code=503, detail="A worker process crashed while rendering the PDF.")
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Could not read PDF '{file.filename}': {str(e)}")
+            pages.extend((file.filename, number, page) for number, page in enumerate(rendered, start=1))
+        else:
+            pages.append((file.filename, 1, contents))
+    if not pages:
+        raise HTTPException(status_code=400, detail="No files provided.")
+    if len(pages) > ANALYZE_BATCH_MAX_PAGES:
+        raise HTTPException(status_code=413, detail=f"At most {ANALYZE_BATCH_MAX_PAGES} pages can be analyzed at once.")
+
+    # Keep this batch from claiming more OCR slots than there are workers, so it never trips the admission limit on its own.
+    slots = asyncio.Semaphore(ocr_pool.workers)
+
+    async def analyze_page(index: int, contents: bytes):
+        try:
+            return index, await analyze_image(contents, ocr_slots=slots), None
+        except HTTPException as e:
+            return index, None, e.detail
+
+    async def page_results():
+        tasks = [asyncio.ensure_future(analyze_page(index, contents)) for index, (_, _, contents) in enumerate(pages)]
+        results = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, data, error = await next_done
+                filename, page_number, _ = pages[index]
+                line = {"type": "page", "index": index, "filename": filename, "page": page_number}
+                if error is None:
+                    line["result"] = data
+                    results.append((index, data))
+                else:
+                    line["error"] = error
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            merged = merge_analyses([data for _, data in sorted(results, key=lambda item: item[0])])
+            yield json.dumps({"type": "merged", "pages": len(pages), "failed_pages": len(pages) - len(results), **merged}, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(page_results(), media_type="application/x-ndjson")
+
+@router.post("/jobs/analyze", status_code=202)
+async def enqueue_analysis_endpoint(file: UploadFile = File(...), priority: int = Form(0)):
+    """Queues an analysis and returns its job id at once; poll GET /jobs/{id} or follow GET /jobs/{id}/events."""
+    with stage("upload_read"):
+        contents = await file.read()
     try:
-        image = Image.open(io.BytesIO(contents))
-        extracted_text = pytesseract.image_to_string(image)
-        if not extracted_text.strip():
-            raise HTTPException(status_code=400, detail="OCR failed: No text could be extracted.")
-        return get_analysis_from_text(extracted_text)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+        with stage("job_enqueue"):
+            job_id = job_queue.enqueue("analyze", contents, priority=priority)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many analyses are waiting. Please try again shortly.", headers={"Retry-After": "30"})
+    return job_queue.get(job_id)
+
+@router.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str, http_request: Request):
+    """Pushes the job as Server-Sent Events: "status" on every change, then "done" or "error" when it finishes."""
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
 
-@app.post("/re-analyze")
+    async def event_stream():
+        async for job in job_queue.watch(job_id):
+            if await http_request.is_disconnected():
+                return
+            if job is None:
+                yield ": keep-alive\n\n"
+            elif job["status"] == "done":
+                yield sse_event("done", job)
+            elif job["status"] == "failed":
+                yield sse_event("error", job)
+            else:
+                yield sse_event("status", job)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/re-analyze")
 async def reanalyze_endpoint(request: ReanalysisRequest):
-    return get_analysis_from_text(request.edited_text)
+    return await get_analysis_from_text(request.edited_text)
 
-@app.post("/summarize")
+@router.post("/correct")
+async def correct_endpoint(request: CorrectionRequest):
+    with stage("spelling"):
+        corrected_text, corrections = spelling_corrector.correct(request.text)
+    return {"text": corrected_text, "corrections": [correction.to_dict() for correction in corrections]}
+
+@router.post("/summarize")
 async def summarize_endpoint(medication_list: MedicationList):
     medications = medication_list.medications
     if not medications:
         raise HTTPException(status_code=400, detail="No medication names provided.")
 
-    prompt_template = f"""
-    You are a helpful AI medical assistant. Your task is to provide clear, concise, and easy-to-understand information about the following medications for a patient.
-
-    **Medication List:**
-    {', '.join(medications)}
+    try:
+        return await drug_store.summarize(medications, generate_drug_info)
+    except (StructuredOutputError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=500, detail="Could not parse the summary from the AI model.")
 
-    **Instructions:**
-    1.  **General Summary:** Write a brief, one-paragraph summary explaining the primary purpose of this combination of medications.
-    2.  **Health Tips:** Provide a bulleted list of 3-5 general health tips that would be beneficial for someone taking these medications.
-    3.  **Food Interactions:** Provide a bulleted list of potential food or drink interactions to be aware of. If there are no well-known major interactions for a drug, state that.
+@router.post("/summarize/stream")
+async def summarize_stream_endpoint(medication_list: MedicationList, http_request: Request):
+    """Streams the summary as Server-Sent Events, one "section" event per key as soon as it is known.
 
-    **CRITICAL OUTPUT FORMAT:**
-    - Your entire response MUST be a single, valid JSON object.
-    - The JSON object must have three keys: "summary", "health_tips", and "food_interactions".
-    - "summary" should contain the paragraph as a single string.
-    - "health_tips" should be a list of strings.
-    - "food_interactions" should be a list of strings.
+    Drugs and combinations already in the drug store are sent straight away; the model is
+    asked only about the rest, with the same prompt /summarize uses.
     """
-    try:
-        response = llm.invoke(prompt_template)
-        cleaned_response = response.content.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_response)
-    except (json.JSONDecodeError, KeyError) as e:
-        raise HTTPException(status_code=500, detail="Could not parse the summary from the AI model.")
+    medications = medication_list.medications
+    if not medications:
+        raise HTTPException(status_code=400, detail="No medication names provided.")
+
+    parts = drug_store.lookup(medications)
+    if not parts.complete:
+        # Built here, so a missing key answers 503 instead of an error event after a 200.
+        llm_gateway.llm
+
+    async def event_stream():
+        sent = {}
 
+        def changed_sections():
+            for key, value in drug_store.sections(parts).items():
+                # The summary is sent once the model has written it, not as a placeholder.
+                if sent.get(key) != value and (key != "summary" or parts.summary is not None):
+                    sent[key] = value
+                    yield sse_event("section", {"key": key, "value": value})
 
-@app.post("/set-reminder")
+        try:
+            if parts.complete:
+                for event in changed_sections():
+                    yield event
+                yield sse_event("done", drug_store.sections(parts))
+                return
+            for event in changed_sections():
+                yield event
+            drug_store.llm_calls += 1
+            parser = JSONSectionParser()
+            reply, learned = [], set()
+            prompt = build_drug_info_prompt(parts.unseen, parts.known)
+            async for text in llm_client.astream(prompt, lane=INTERACTIVE, **structured_output.options(DrugInfoBatch)):
+                if await http_request.is_disconnected():
+                    return
+                reply.append(text)
+                for key, value in parser.feed(text):
+                    try:
+                        section = DrugInfoBatch.model_validate({key: value}).model_dump()
+                    except ValueError:
+                        continue
+                    learned.add(key)
+                    if key == "drugs":
+                        drug_store.learn_drugs(parts, section["drugs"])
+                    elif key == "summary":
+                        drug_store.learn_summary(parts, section["summary"])
+                    for event in changed_sections():
+                        yield event
+            try:
+                # Validate the whole reply; local repair recovers sections the incremental parser could not.
+                generated = structured_output.parse("drug_info", "".join(reply), DrugInfoBatch).model_dump()
+            except StructuredOutputError:
+                generated = None
+            if generated is not None:
+                if "drugs" not in learned:
+                    drug_store.learn_drugs(parts, generated["drugs"])
+                if parts.summary is None:
+                    drug_store.learn_summary(parts, generated["summary"])
+            elif parts.summary is None:
+                yield sse_event("error", {"detail": "Could not parse the summary from the AI model."})
+                return
+            for event in changed_sections():
+                yield event
+            yield sse_event("done", drug_store.sections(parts))
+        except Exception as e:
+            yield sse_event("error", {"detail": f"An error occurred while summarizing: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/set-reminder")
 async def set_reminder_endpoint(reminder_data: ReminderRequest):
     if not reminder_data.access_token:
         raise HTTPException(status_code=401, detail="Missing authentication token.")
 
-    if reminder_data.days_duration <= 0:
-       raise HTTPException(status_code=400, detail="Medication duration must be 1 day or more.")
+    if not 0 < reminder_data.days_duration <= MAX_REMINDER_DAYS:
+       raise HTTPException(status_code=400, detail=f"Medication duration must be between 1 and {MAX_REMINDER_DAYS} days.")
         
     try:
-        creds = Credentials(token=reminder_data.access_token)
-        service = build('calendar', 'v3', credentials=creds)
-
-        local_tz = pytz.timezone(TIMEZONE)
-        today = datetime.now(local_tz).date()
-        hour, minute = map(int, reminder_data.time.split(':'))
-        start_datetime = local_tz.localize(datetime(today.year, today.month, today.day, hour, minute))
-        end_datetime = start_datetime + timedelta(minutes=30) 
-        
-        last_dose_date = start_datetime.date() + timedelta(days=reminder_data.days_duration - 1)
-        utc_end_of_day = local_tz.localize(datetime(last_dose_date.year, last_dose_date.month, last_dose_date.day, 23, 59, 59)).astimezone(pytz.utc)
-        until_string = utc_end_of_day.strftime('%Y%m%dT%H%M%SZ')
-        rrule = f'RRULE:FREQ=DAILY;INTERVAL=1;UNTIL={until_string}'
-        
-        event = { 
-            'summary': f"Medication Reminder: Take {reminder_data.name}", 
-            'description': f"Dosage/Instruction: {reminder_data.instruction} (Duration: {reminder_data.days_duration} days)", 
-            'start': {'dateTime': start_datetime.isoformat(), 'timeZone': TIMEZONE}, 
-            'end': {'dateTime': end_datetime.isoformat(), 'timeZone': TIMEZONE}, 
-            'reminders': {'useDefault': False, 'overrides': [{'method': 'popup', 'minutes': 10}]}, 
-            'recurrence': [rrule]
-        }
-        
-        inserted_event = service.events().insert(calendarId='primary', body=event).execute()
+        service = get_calendar_service(reminder_data.access_token)
+        event = build_reminder_event(reminder_data.name, reminder_data.instruction, reminder_data.time, reminder_data.days_duration)
+        inserted_event = await asyncio.to_thread(insert_event, service, event)
         
         return { 
             "status": "success", 
@@ -331,101 +762,319 @@ async def set_reminder_endpoint(reminder_data: ReminderRequest):
         raise HTTPException(status_code=401, detail=f"Failed to create event. Your login may have expired. Please log in again.")
 
 
-@app.post("/translate")
+@router.post("/set-reminders")
+async def set_reminders_endpoint(batch_request: BatchReminderRequest):
+    """Creates reminders for a whole medication list with one Calendar batch request; reports success per item."""
+    if not batch_request.access_token:
+        raise HTTPException(status_code=401, detail="Missing authentication token.")
+    if not batch_request.reminders:
+        raise HTTPException(status_code=400, detail="No reminders provided.")
+
+    results = [None] * len(batch_request.reminders)
+    events, event_indexes = [], []
+    for index, item in enumerate(batch_request.reminders):
+        if not 0 < item.days_duration <= MAX_REMINDER_DAYS:
+            results[index] = {"name": item.name, "status": "error", "detail": f"Medication duration must be between 1 and {MAX_REMINDER_DAYS} days."}
+            continue
+        try:
+            events.append(build_reminder_event(item.name, item.instruction, item.time, item.days_duration))
+            event_indexes.append(index)
+        except ValueError:
+            results[index] = {"name": item.name, "status": "error", "detail": "Time must be in HH:MM format."}
+
+    if events:
+        try:
+            service = get_calendar_service(batch_request.access_token)
+            outcomes = await asyncio.to_thread(insert_events_batch, service, events)
+        except Exception as e:
+            print(f"Google Calendar API Error: {e}")
+            raise HTTPException(status_code=401, detail="Failed to create events. Your login may have expired. Please log in again.")
+
+        if all(isinstance(outcome, Exception) and is_auth_error(outcome) for outcome in outcomes):
+            raise HTTPException(status_code=401, detail="Failed to create events. Your login may have expired. Please log in again.")
+
+        for index, outcome in zip(event_indexes, outcomes):
+            name = batch_request.reminders[index].name
+            if isinstance(outcome, Exception) or outcome is None:
+                print(f"Google Calendar API Error for '{name}': {outcome}")
+                results[index] = {"name": name, "status": "error", "detail": "Failed to create event on Google Calendar."}
+            else:
+                results[index] = {
+                    "name": name,
+                    "status": "success",
+                    "event_id": outcome.get('id'),
+                    "calendar_link": outcome.get('htmlLink'),
+                }
+
+    created = sum(1 for result in results if result["status"] == "success")
+    return {
+        "status": "success" if created == len(results) else ("partial" if created else "error"),
+        "created": created,
+        "failed": len(results) - created,
+        "results": results,
+    }
+
+
+@router.post("/translate")
 async def translate_endpoint(request: TranslationRequest):
+    """Translates the string values of `content`; with `target_languages`, returns {"translations": {language: content}}."""
     if not request.content:
         raise HTTPException(status_code=400, detail="No content provided for translation.")
+    languages = list(dict.fromkeys(request.target_languages or ([request.target_language] if request.target_language else [])))
+    if not languages:
+        raise HTTPException(status_code=400, detail="No target language provided.")
 
     try:
-        content_json_str = json.dumps(request.content, indent=2, ensure_ascii=False)
-        prompt_template = f"""
-        You are a highly skilled translation AI. Your task is to translate the user-provided JSON content into {request.target_language}.
-
-        **CRITICAL INSTRUCTIONS:**
-        1.  **Translate ONLY the string values.** Do not translate the JSON keys (e.g., "name", "dosage", "summary").
-        2.  **Preserve the original JSON structure EXACTLY.** The output must be a valid JSON object with the same keys and nesting.
-        3.  **Keep special medical terms as is:** Do not translate specific medical terms or strings like "N/A" or "Illegible".
-        4.  **Handle numbers:** Numbers should not be translated or changed.
-        5.  **Language Script:** Use the native script for the target language (e.g., Devanagari for Hindi).
-        6.  **Your final output must ONLY be the translated JSON object, and nothing else.** Do not wrap it in ```json``` or add any conversational text.
-
-        **TARGET LANGUAGE:** {request.target_language}
-
-        **JSON TO TRANSLATE:**
-        ---
-        {content_json_str}
-        ---
-        """
-        response = llm.invoke(prompt_template)
-        cleaned_response = response.content.strip().replace("```json", "").replace("```", "")
-        if not cleaned_response: raise ValueError("LLM returned an empty response for translation.")
-        return json.loads(cleaned_response)
+        translations = await translation_memory.translate(request.content, languages, translate_strings)
+    except MissingConfiguration:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An internal server error occurred during translation: {str(e)}")
 
-@app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    context_str = "No prescription data available."
-    if request.analysis_data:
-        context_str = f"The user's current prescription analysis is:\n{json.dumps(request.analysis_data, indent=2)}"
-
-    system_prompt = f"""
-    You are an AI Healthcare Planning Agent. Your primary role is to assist users with questions about their medication schedule and general health inquiries based on their prescription.
-
-    **Your Core Traits:**
-    - **Proactive:** You anticipate user needs.
-    - **Reasoning:** You understand interactions, risks, and schedules based on the provided context.
-    - **Personalized:** Your advice is tailored to the user's specific prescription data.
-    - **Autonomous:** You can provide clear next steps and suggestions without needing manual intervention for simple queries.
-    - **Explainable:** You provide the reasoning for your advice.
-
-    **IMPORTANT SAFETY RULE:** You are an AI assistant, NOT a doctor. You MUST ALWAYS include a disclaimer to consult a healthcare professional for any medical decisions. Never give definitive medical advice. You can provide information and suggestions based ONLY on the data provided.
+    if request.target_languages:
+        return {"translations": translations}
+    return translations[languages[0]]
 
-    **User's Prescription Context:**
-    {context_str}
-
-    Now, please continue the conversation with the user.
-    """
-    langchain_messages = [SystemMessage(content=system_prompt)]
-    for msg in request.messages[1:]:
-        if msg["role"] == 'user': langchain_messages.append(HumanMessage(content=msg["text"]))
-        elif msg["role"] == 'ai': langchain_messages.append(AIMessage(content=msg["text"]))
+@router.post("/chat")
+async def chat_endpoint(request: ChatRequest):
     try:
-        response = llm.invoke(langchain_messages)
-        return {"response": response.content}
+        langchain_messages, usage = await build_chat_messages(request)
+        response = await llm_client.ainvoke(langchain_messages, lane=INTERACTIVE)
+        usage_metadata = getattr(response, "usage_metadata", None) or {}
+        usage["input_tokens"] = usage_metadata.get("input_tokens", usage["estimated_input_tokens"])
+        return {"response": response.content, "usage": usage}
+    except MissingConfiguration:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred in the AI chat agent: {str(e)}")
 
-@app.post("/find-pharmacies")
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """Streams the assistant's reply as Server-Sent Events ("token" events, then "done")."""
+    # Built here, so a missing key answers 503 instead of an error event after a 200.
+    llm_gateway.llm
+
+    async def event_stream():
+        reply = []
+        try:
+            langchain_messages, usage = await build_chat_messages(request)
+            # Streamed chunks carry no usage metadata, so report the same context-trim estimate /chat falls back to.
+            usage["input_tokens"] = usage["estimated_input_tokens"]
+            async for text in llm_client.astream(langchain_messages, lane=INTERACTIVE):
+                # Stop pulling tokens once the client is gone; closing the stream cancels the generation.
+                if await http_request.is_disconnected():
+                    return
+                if text:
+                    reply.append(text)
+                    yield sse_event("token", {"text": text})
+            yield sse_event("done", {"response": "".join(reply), "usage": usage})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"An error occurred in the AI chat agent: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/find-pharmacies")
 async def find_pharmacies_endpoint(location: LocationRequest):
-    if not maps_api_key:
+    if MAPS_PROVIDER != "fake" and not maps_api_key:
         raise HTTPException(status_code=503, detail="Google Maps API key is not configured on the server.")
     
-    gmaps = googlemaps.Client(key=maps_api_key)
-    
     try:
-        places_result = gmaps.places_nearby(
-            location=(location.latitude, location.longitude),
-            keyword='pharmacy',
-            rank_by='distance'
-        )
-        results = []
-        for place in places_result.get('results', [])[:5]:
-            place_id = place.get('place_id')
-            place_geometry = place.get('geometry') 
-            
-            if not place_id or not place_geometry: 
-                continue
-
-            details = gmaps.place(place_id=place_id, fields=['formatted_phone_number'])
-            place_details = details.get('result', {})
-            
-            results.append({
-                'name': place.get('name'),
-                'address': place.get('vicinity'),
-                'phone': place_details.get('formatted_phone_number', 'N/A'),
-                'geometry': place_geometry 
-            })
-        return results
+        return await pharmacy_finder.find(location.latitude, location.longitude)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred while searching for pharmacies: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An error occurred while searching for pharmacies: {str(e)}")
+
+def cache_metrics():
+    """Cache hit and miss counts for /metrics, read from each cache's own counters at scrape time."""
+    counts = {
+        name: (cache.memory.hits, cache.disk_hits, cache.misses)
+        for name, cache in {
+            "analysis_image": analysis_cache.images,
+            "analysis_text": analysis_cache.texts,
+            "translation": translation_memory.entries,
+            "drug_info": drug_store.drugs,
+            "drug_combination": drug_store.combinations,
+        }.items()
+    }
+    counts["pharmacy_results"] = (pharmacy_finder.results.hits, 0, pharmacy_finder.results.misses)
+    counts["pharmacy_details"] = (pharmacy_finder.details.hits, 0, pharmacy_finder.details.misses)
+
+    lookups, ratios = [], []
+    for name, (memory_hits, disk_hits, misses) in counts.items():
+        lookups += [
+            ({"cache": name, "result": "memory_hit"}, memory_hits),
+            ({"cache": name, "result": "disk_hit"}, disk_hits),
+            ({"cache": name, "result": "miss"}, misses),
+        ]
+        total = memory_hits + disk_hits + misses
+        ratios.append(({"cache": name}, (memory_hits + disk_hits) / total if total else 0.0))
+    yield "cache_lookups_total", "counter", "Cache lookups by cache and result.", lookups
+    yield "cache_hit_ratio", "gauge", "Share of lookups served from cache since startup.", ratios
+
+
+def runtime_metrics():
+    """Queue depths and limits of the OCR pool and the LLM gateway."""
+    ocr = ocr_pool.stats()
+    gateway = llm_gateway.stats()
+    yield "ocr_queue_depth", "gauge", "OCR jobs waiting for a worker.", [({}, ocr["queue_depth"])]
+    yield "ocr_running", "gauge", "OCR jobs running on a worker.", [({}, ocr["running"])]
+    yield "llm_concurrency_limit", "gauge", "Current adaptive LLM concurrency limit.", [({}, gateway["concurrency_limit"])]
+    yield "llm_waiting", "gauge", "LLM calls waiting for admission, by lane.", [
+        ({"lane": lane}, count) for lane, count in gateway["waiting"].items()
+    ]
+    yield "module_import_seconds", "gauge", "Time taken to import main.py.", [({}, import_seconds)]
+
+registry.register_collector(cache_metrics)
+registry.register_collector(runtime_metrics)
+
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: request and stage latency histograms, LLM calls and tokens, cache hit rates."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- Client Warm-Up ---
+# After startup the slow clients are built on a worker thread. /healthz answers at once, and
+# /readyz only reports ready once the first real request will not have to wait for them.
+WARM_CLIENTS = os.getenv("WARM_CLIENTS", "1") != "0"
+warmup = {"status": "pending" if WARM_CLIENTS else "disabled", "seconds": None, "clients": {}}
+
+
+def _warm_calendar():
+    from googleapiclient.discovery import build_from_document  # noqa: F401
+    calendar_discovery_doc()
+
+
+def _warm_oauth():
+    from google_auth_oauthlib.flow import Flow  # noqa: F401
+    oauth_client_config()
+
+
+def warm_clients():
+    started = time.perf_counter()
+    clients = {"llm": lambda: llm_gateway.llm}
+    if MAPS_PROVIDER != "fake" and maps_api_key:
+        clients["maps"] = lambda: pharmacy_finder.client
+    if CALENDAR_PROVIDER != "fake":
+        clients["calendar"] = _warm_calendar
+        clients["oauth"] = _warm_oauth
+    for name, load in clients.items():
+        try:
+            load()
+            warmup["clients"][name] = "ok"
+        except Exception as e:
+            print(f"WARNING: Could not warm up the {name} client: {e}")
+            warmup["clients"][name] = f"error: {e}"
+    warmup["seconds"] = round(time.perf_counter() - started, 3)
+    warmup["status"] = "done"
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    ocr_pool.start()
+    job_queue.start()
+    if WARM_CLIENTS:
+        asyncio.get_running_loop().run_in_executor(None, warm_clients)
+    try:
+        yield
+    finally:
+        ocr_pool.shutdown()
+        pharmacy_finder.shutdown()
+        await job_queue.shutdown()
+
+
+# --- Health Checks ---
+@router.get("/healthz")
+async def liveness_endpoint():
+    """Liveness: the process is up and the event loop answers."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readiness_endpoint():
+    """Readiness: 200 once this worker can serve every endpoint without cold-start delays, 503 until then.
+
+    The Maps and OAuth clients are reported but not required, since only some endpoints use them.
+    """
+    checks = {
+        # A pool whose worker died is replaced here, but this probe still fails so the crash is visible.
+        "ocr_pool": ocr_pool.started and not ocr_pool.recover(),
+        "job_queue": job_queue.started,
+        "llm_configured": LLM_PROVIDER == "fake" or bool(api_key),
+        "warmup": warmup["status"] in ("done", "disabled") and warmup["clients"].get("llm", "ok") == "ok",
+    }
+    optional = {
+        "maps_configured": MAPS_PROVIDER == "fake" or bool(maps_api_key),
+        "oauth_credentials": CALENDAR_PROVIDER == "fake" or OAUTH_CREDENTIALS_PATH.exists(),
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "checks": {**checks, **optional},
+        "warmup": warmup,
+        "import_seconds": round(import_seconds, 3),
+        "import_time_budget_seconds": IMPORT_TIME_BUDGET_SECONDS,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@router.get("/stats")
+async def stats_endpoint():
+    """Reports runtime statistics for the backend's internal subsystems."""
+    return {
+        "ocr": ocr_pool.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "spelling": spelling_corrector.stats(),
+        "rule_extractor": rule_extractor.stats(),
+        "llm": llm_client.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "structured_output": structured_output.stats(),
+        "jobs": job_queue.stats(),
+        "chat_context": chat_context.stats(),
+        "translation_memory": translation_memory.stats(),
+        "drug_store": drug_store.stats(),
+        "pharmacies": pharmacy_finder.stats(),
+        "slow_requests": profiler.stats(),
+        "startup": {
+            "import_seconds": round(import_seconds, 3),
+            "import_time_budget_seconds": IMPORT_TIME_BUDGET_SECONDS,
+            "warmup": warmup,
+        },
+    }
+
+
+# --- App Factory ---
+async def missing_configuration_handler(request: Request, exc: MissingConfiguration):
+    return JSONResponse({"detail": str(exc)}, status_code=503)
+
+
+def create_app() -> FastAPI:
+    """Builds the FastAPI app around the module's routes and shared clients.
+
+    `uvicorn main:app` serves the instance created below; `uvicorn main:create_app --factory`
+    builds one per worker.
+    """
+    app = FastAPI(lifespan=lifespan)
+    origins = [ "http://localhost:3000" ]
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Lets the browser's dev tools read the per-stage timings on cross-origin responses.
+        expose_headers=["Server-Timing"],
+    )
+    # Added last so it wraps everything else; times each request and adds the Server-Timing header.
+    app.add_middleware(InstrumentationMiddleware)
+    app.add_exception_handler(MissingConfiguration, missing_configuration_handler)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
+
+# --- Import-Time Budget ---
+# Measured from the first line of this module, so it covers every import and client set up above.
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "1.0"))
+import_seconds = time.perf_counter() - _import_started
+if import_seconds > IMPORT_TIME_BUDGET_SECONDS:
+    print(f"WARNING: Importing main.py took {import_seconds:.2f}s, over the {IMPORT_TIME_BUDGET_SECONDS:.2f}s budget.")
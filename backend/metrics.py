@@ -0,0 +1,282 @@
+import collections
+import contextlib
+import contextvars
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+# --- Instrumentation Configuration ---
+# Requests slower than this are profiled by the sampling profiler; 0 turns the profiler off.
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# --- Metric Types ---
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# A collector returns (name, type, help, [(labels dict, value)]) for values read at scrape time.
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Collector] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help_text, samples in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time to send the response headers, by route.", ("method", "route", "status"))
+STAGE_DURATION = registry.histogram(
+    "stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+LLM_TOKENS = registry.counter("llm_tokens_total", "LLM tokens reported by the model.", ("lane", "direction"))
+LLM_CALLS = registry.counter("llm_calls_total", "LLM call attempts by outcome.", ("lane", "outcome"))
+
+
+# --- Per-Request Stage Timings ---
+_request_timings: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    """Adds a stage duration to the histogram and, inside a request, to its Server-Timing header."""
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.setdefault(name, []).append(seconds)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Times the enclosed block as one stage; works around `await` as well as plain code."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing(timings: Dict[str, List[float]], total: float) -> str:
+    entries = []
+    for name, durations in timings.items():
+        entry = f"{name};dur={sum(durations) * 1000:.1f}"
+        if len(durations) > 1:
+            entry += f';desc="{len(durations)} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# --- Sampling Profiler ---
+class SlowRequestProfiler:
+    """Samples the event loop thread's stack while requests run and keeps the profile of slow ones.
+
+    Samples are only taken while at least one request is in flight; a request slower than
+    `threshold_ms` gets the samples from its own time window, collapsed into stack counts.
+    """
+
+    def __init__(self, threshold_ms: float = PROFILE_SLOW_REQUEST_MS, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS,
+                 keep: int = 20):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.profiles: Deque[dict] = collections.deque(maxlen=keep)
+        self._samples: Deque[Tuple[float, Tuple[str, ...]]] = collections.deque(maxlen=100000)
+        self._active = 0
+        self._thread_id: Optional[int] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stack = tuple(f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})"
+                              for entry in traceback.extract_stack(frame, limit=30))
+                self._samples.append((time.perf_counter(), stack))
+            time.sleep(self.interval)
+
+    def request_started(self):
+        if not self.enabled:
+            return
+        if self._sampler is None:
+            self._thread_id = threading.get_ident()
+            self._sampler = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._sampler.start()
+        self._active += 1
+        self._wake.set()
+
+    def request_finished(self, method: str, path: str, started: float, duration: float):
+        if not self.enabled:
+            return
+        self._active -= 1
+        if self._active == 0:
+            self._wake.clear()
+        if duration < self.threshold:
+            return
+        stacks = collections.Counter(stack for at, stack in list(self._samples) if started <= at <= started + duration)
+        profile = {
+            "method": method,
+            "path": path,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(stacks.values()),
+            "top_stacks": [{"stack": ";".join(stack[-8:]), "samples": count} for stack, count in stacks.most_common(10)],
+        }
+        self.profiles.append(profile)
+        print(f"WARNING: Slow request {method} {path} took {profile['duration_ms']} ms; {profile['samples']} samples profiled.")
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "threshold_ms": self.threshold * 1000, "recent": list(self.profiles)}
+
+
+profiler = SlowRequestProfiler()
+
+
+# --- ASGI Middleware ---
+class InstrumentationMiddleware:
+    """Times every HTTP request, adds a Server-Timing header and records the request histogram.
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware, so streamed responses pass through untouched.
+    Stages that finish after the headers are sent (e.g. inside a stream) still reach the histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, List[float]] = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = {"code": 500}
+        profiler.request_started()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                total = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, total).encode("latin-1")))
+                message = {**message, "headers": headers}
+                # Label by route template, not raw path, so /jobs/{job_id} stays one series and 404 scans add none.
+                route = scope.get("route")
+                REQUEST_DURATION.observe(total, method=scope["method"], route=getattr(route, "path", "unmatched"),
+                                         status=status["code"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            profiler.request_finished(scope["method"], scope["path"], started, time.perf_counter() - started)
@@ -0,0 +1,196 @@
+import os
+import re
+import statistics
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from preprocess import _env_flag
+
+
+# --- Layout Configuration ---
+@dataclass
+class LayoutConfig:
+    """How Tesseract's word boxes are turned into the text sent for analysis."""
+    enabled: bool = _env_flag("OCR_LAYOUT_ENABLED", True)
+    # Send only the rows from the first medication to the signature, instead of the whole page.
+    region_only: bool = _env_flag("OCR_REGION_ONLY", True)
+    # Words below this confidence (0-100) are tagged as [?word] for the model.
+    low_confidence: float = float(os.getenv("OCR_LOW_CONFIDENCE", "60"))
+    # Words below this confidence in the page margins, or with no letters or digits, are dropped as noise.
+    noise_confidence: float = float(os.getenv("OCR_NOISE_CONFIDENCE", "30"))
+    margin_fraction: float = float(os.getenv("OCR_MARGIN_FRACTION", "0.05"))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+_RX = re.compile(r"^\s*(?:r\s*x|℞)\b", re.I)
+_MEDICATION_LINE = re.compile(
+    r"^\s*(?:\d{1,2}\s*[.)]\s*)?(?:tabs?|tablets?|caps?|capsules?|syp|syrup|susp|inj|oint|drops?|cream|gel)\b", re.I)
+_DOSE_PATTERN = re.compile(r"(?<![\d.])[0-2½]\s*[-–]\s*[0-2½]\s*[-–]\s*[0-2½](?![\d.])")
+# Letterhead and patient-detail rows: clinic name, doctor and degrees, address, contacts, patient fields, dates.
+_HEADER = re.compile(
+    r"\b(clinic|hospital|nursing\s+home|medical\s+cent(?:re|er)|polyclinic|dr|mbbs|bams|bhms|bds|frcs|mrcp|"
+    r"reg(?:d|istration)?\.?\s*no|address|road|rd|street|st|nagar|lane|colony|sector|pin|ph|phone|mob(?:ile)?|tel|"
+    r"e-?mail|www|timings?|patient|name|age|sex|gender|dob|uhid|op\s*no|ip\s*no|date)\b"
+    r"|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\+?\d[\d\s-]{8,}\d|@", re.I)
+_FOOTER = re.compile(r"\b(signature|signed|stamp|seal|not valid|medico[\s-]*legal|get well soon)\b", re.I)
+
+
+@dataclass
+class OCRWord:
+    text: str
+    confidence: float
+    left: int
+    top: int
+    width: int
+    height: int
+
+    @property
+    def right(self) -> int:
+        return self.left + self.width
+
+    @property
+    def bottom(self) -> int:
+        return self.top + self.height
+
+
+@dataclass
+class OCRLine:
+    """Words Tesseract placed on one line of one text block, left to right."""
+    words: List[OCRWord]
+
+    @property
+    def left(self) -> int:
+        return min(word.left for word in self.words)
+
+    @property
+    def top(self) -> int:
+        return min(word.top for word in self.words)
+
+    @property
+    def bottom(self) -> int:
+        return max(word.bottom for word in self.words)
+
+    @property
+    def center(self) -> float:
+        return (self.top + self.bottom) / 2
+
+
+@dataclass
+class OCRRow:
+    """Lines from different blocks that sit at the same height, such as the columns of a medication table."""
+    lines: List[OCRLine] = field(default_factory=list)
+
+    def plain_text(self) -> str:
+        return " ".join(word.text for line in self.lines for word in line.words)
+
+    def render(self, low_confidence: float) -> str:
+        columns = []
+        for line in self.lines:
+            columns.append(" ".join(
+                f"[?{word.text}]" if word.confidence < low_confidence else word.text for word in line.words
+            ))
+        return " | ".join(columns)
+
+
+def words_from_data(data: Dict[str, list]) -> Dict[Tuple[int, int, int], List[OCRWord]]:
+    """Groups the word entries of a pytesseract `image_to_data` dict by (block, paragraph, line)."""
+    lines: Dict[Tuple[int, int, int], List[OCRWord]] = {}
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        confidence = float(data["conf"][i])
+        if not text or confidence < 0:
+            continue
+        word = OCRWord(text, confidence, int(data["left"][i]), int(data["top"][i]),
+                       int(data["width"][i]), int(data["height"][i]))
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+    return lines
+
+
+def _is_noise(word: OCRWord, page_width: int, page_height: int, config: LayoutConfig) -> bool:
+    if not any(char.isalnum() for char in word.text):
+        return word.confidence < config.low_confidence
+    if word.confidence >= config.noise_confidence:
+        return False
+    margin_x, margin_y = page_width * config.margin_fraction, page_height * config.margin_fraction
+    return (word.right < margin_x or word.left > page_width - margin_x
+            or word.bottom < margin_y or word.top > page_height - margin_y)
+
+
+def build_rows(lines: List[OCRLine]) -> List[OCRRow]:
+    """Merges lines into rows when they overlap vertically by at least half the smaller line height."""
+    rows: List[OCRRow] = []
+    for line in sorted(lines, key=lambda line: line.center):
+        if rows:
+            row = rows[-1]
+            top, bottom = min(l.top for l in row.lines), max(l.bottom for l in row.lines)
+            overlap = min(bottom, line.bottom) - max(top, line.top)
+            if overlap >= 0.5 * min(bottom - top, line.bottom - line.top):
+                row.lines.append(line)
+                continue
+        rows.append(OCRRow([line]))
+    for row in rows:
+        row.lines.sort(key=lambda line: line.left)
+    return rows
+
+
+def medication_region(rows: List[OCRRow]) -> Tuple[int, int]:
+    """Returns the [start, end) row range from the first medication row to the signature or footer.
+
+    The letterhead, patient details and footer carry nothing the analysis needs. Without an Rx row,
+    only the leading rows that are clearly header material are dropped, since a first medication
+    written without a form prefix or dose pattern isn't recognized as one. If no medication row is
+    recognized, the whole page is kept.
+    """
+    start = None
+    for index, row in enumerate(rows):
+        text = row.plain_text()
+        if _RX.match(text):
+            # A bare "Rx" line only marks where the list begins.
+            start = index + 1 if len(text.strip()) <= 3 else index
+            break
+        if _MEDICATION_LINE.match(text) or _DOSE_PATTERN.search(text):
+            start = next((before for before in range(index) if not _HEADER.search(rows[before].plain_text())), index)
+            break
+    if start is None:
+        return 0, len(rows)
+    end = len(rows)
+    for index in range(start + 1, len(rows)):
+        if _FOOTER.search(rows[index].plain_text()):
+            end = index
+            break
+    return start, end
+
+
+def layout_text(data: Dict[str, list], page_size: Tuple[int, int], config: Optional[LayoutConfig] = None) -> dict:
+    """Turns an `image_to_data` result into compact, annotated text plus layout statistics."""
+    config = config or LayoutConfig()
+    page_width, page_height = page_size
+    grouped = words_from_data(data)
+
+    lines, total_words, dropped_words = [], 0, 0
+    for words in grouped.values():
+        total_words += len(words)
+        kept = [word for word in words if not _is_noise(word, page_width, page_height, config)]
+        dropped_words += len(words) - len(kept)
+        if kept:
+            lines.append(OCRLine(sorted(kept, key=lambda word: word.left)))
+
+    rows = [row for row in build_rows(lines) if sum(char.isalnum() for char in row.plain_text()) >= 2]
+    start, end = medication_region(rows) if config.region_only else (0, len(rows))
+    selected = rows[start:end]
+    words = [word for row in selected for line in row.lines for word in line.words]
+    low_confidence_words = sum(1 for word in words if word.confidence < config.low_confidence)
+
+    return {
+        "text": "\n".join(row.render(config.low_confidence) for row in selected),
+        "layout": {
+            "words": total_words,
+            "noise_words": dropped_words,
+            "rows": len(rows),
+            "kept_rows": len(selected),
+            "low_confidence_words": low_confidence_words,
+            "mean_confidence": round(statistics.fmean(word.confidence for word in words), 1) if words else 0.0,
+        },
+    }
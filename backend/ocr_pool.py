@@ -0,0 +1,262 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from metrics import record_stage
+from ocr_layout import LayoutConfig, layout_text
+from preprocess import PreprocessConfig, preprocess_image
+
+
+# --- OCR Pool Configuration ---
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "8"))
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "30"))
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+
+
+class OCRQueueFull(Exception):
+    """Raised when the admission queue is full; carries a Retry-After hint in seconds."""
+    def __init__(self, retry_after: int):
+        super().__init__(f"OCR queue is full. Retry after {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class OCRTimeout(Exception):
+    """Raised when a single OCR job exceeds its time limit."""
+
+
+class OCRWorkerCrashed(Exception):
+    """Raised when a worker process died (e.g. out of memory) while running the job, even on a fresh pool."""
+
+
+# --- Worker Process Functions ---
+# These run inside the pool's child processes, so they only import what OCR needs.
+
+def _init_worker(tesseract_cmd: str):
+    import pytesseract
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _run_ocr(contents: bytes, timeout: float, config: PreprocessConfig, layout_config: LayoutConfig) -> dict:
+    import pytesseract
+
+    image, timings = preprocess_image(contents, config)
+    started_at = time.perf_counter()
+    try:
+        if layout_config.enabled:
+            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, timeout=timeout)
+        else:
+            text = pytesseract.image_to_string(image, timeout=timeout)
+    except RuntimeError as e:
+        # pytesseract kills the tesseract process and raises RuntimeError on timeout.
+        if "timeout" in str(e).lower():
+            raise OCRTimeout(f"OCR job exceeded {timeout}s.")
+        raise
+    timings["tesseract"] = round(1000 * (time.perf_counter() - started_at), 2)
+    if not layout_config.enabled:
+        return {"text": text, "timings_ms": timings}
+
+    started_at = time.perf_counter()
+    result = layout_text(data, image.size, layout_config)
+    timings["layout"] = round(1000 * (time.perf_counter() - started_at), 2)
+    result["timings_ms"] = timings
+    return result
+
+
+def _render_pdf_pages(contents: bytes, dpi: int, max_pages: int) -> list:
+    # PyMuPDF is optional; it is only needed when PDFs are uploaded.
+    import pymupdf
+
+    pages = []
+    with pymupdf.open(stream=contents, filetype="pdf") as document:
+        if document.page_count > max_pages:
+            raise ValueError(f"PDF has {document.page_count} pages; at most {max_pages} are allowed.")
+        for page in document:
+            pages.append(page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY).tobytes("png"))
+    return pages
+
+
+# --- OCR Pool ---
+class OCRPool:
+    """Runs Tesseract in a bounded process pool so OCR never blocks the event loop."""
+
+    # The functions run on the workers; subclasses can swap them (see fake_backends.FakeOCRPool).
+    ocr_job = staticmethod(_run_ocr)
+    render_job = staticmethod(_render_pdf_pages)
+
+    def __init__(self, workers: int = OCR_WORKERS, queue_size: int = OCR_QUEUE_SIZE,
+                 timeout: float = OCR_TIMEOUT_SECONDS, tesseract_cmd: str = "",
+                 preprocess_config: PreprocessConfig = None, layout_config: LayoutConfig = None):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self.tesseract_cmd = tesseract_cmd
+        self.preprocess_config = preprocess_config or PreprocessConfig()
+        self.layout_config = layout_config or LayoutConfig()
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._crashed = 0
+        self._restarts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+        self._step_totals = {}
+        self._layout_totals = {}
+        self._layout_jobs = 0
+
+    def _make_executor(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.tesseract_cmd,),
+        )
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._make_executor()
+            self._slots = asyncio.Semaphore(self.workers)
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def broken(self) -> bool:
+        """True once a worker process has died; the executor then refuses every job until it is replaced."""
+        # ProcessPoolExecutor notices a dead worker on its own and sets this flag.
+        return bool(getattr(self._executor, "_broken", False))
+
+    def _replace_executor(self, broken: Executor):
+        """Swaps a broken executor for a fresh one; only the first caller to see `broken` does the work."""
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            print("WARNING: An OCR worker process died; starting a new pool.")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._make_executor()
+            self._restarts += 1
+
+    def recover(self) -> bool:
+        """Replaces the executor if a worker died while it was idle; returns whether it was broken."""
+        executor = self._executor
+        if executor is None or not self.broken:
+            return False
+        self._replace_executor(executor)
+        return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def _retry_after(self) -> int:
+        """Estimates how long until a slot frees up, from the average job time so far."""
+        avg_run = self._total_run / self._completed if self._completed else self.timeout / 2
+        queued = max(0, self._pending - self._running)
+        return max(1, int(avg_run * (queued + 1) / self.workers + 0.5))
+
+    async def submit(self, fn, *args):
+        """Admits a job into the bounded queue and runs `fn(*args)` on a worker process."""
+        self.start()
+        if self._pending >= self.workers + self.queue_size:
+            self._rejected += 1
+            raise OCRQueueFull(self._retry_after())
+
+        self._pending += 1
+        enqueued_at = time.monotonic()
+        try:
+            async with self._slots:
+                wait = time.monotonic() - enqueued_at
+                record_stage("ocr_wait", wait)
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+                self._running += 1
+                started_at = time.monotonic()
+                loop = asyncio.get_running_loop()
+                try:
+                    for attempt in range(2):
+                        executor = self._executor
+                        try:
+                            # A little grace on top of tesseract's own timeout, which kills the subprocess itself.
+                            result = await asyncio.wait_for(
+                                loop.run_in_executor(executor, fn, *args),
+                                timeout=self.timeout + 5,
+                            )
+                            break
+                        except BrokenProcessPool:
+                            # One dead worker fails every job in flight; each gets one more try on a fresh pool.
+                            self._replace_executor(executor)
+                            if attempt == 1:
+                                self._crashed += 1
+                                raise OCRWorkerCrashed("An OCR worker process crashed while reading the image.")
+                except (asyncio.TimeoutError, OCRTimeout):
+                    self._timed_out += 1
+                    raise OCRTimeout(f"OCR job exceeded {self.timeout}s.")
+                except OCRWorkerCrashed:
+                    raise
+                except Exception:
+                    self._failed += 1
+                    raise
+                finally:
+                    self._running -= 1
+
+                self._completed += 1
+                self._total_run += time.monotonic() - started_at
+                return result
+        finally:
+            self._pending -= 1
+
+    async def ocr(self, contents: bytes) -> dict:
+        """Preprocesses and OCRs an image; returns its text, per-step timings in milliseconds and layout statistics."""
+        result = await self.submit(self.ocr_job, contents, self.timeout, self.preprocess_config, self.layout_config)
+        for step, ms in result["timings_ms"].items():
+            self._step_totals[step] = self._step_totals.get(step, 0.0) + ms
+            # The steps ran in the worker process, so they are recorded here from its reported timings.
+            record_stage(f"ocr_{step}", ms / 1000)
+        if "layout" in result:
+            self._layout_jobs += 1
+            for key, value in result["layout"].items():
+                self._layout_totals[key] = self._layout_totals.get(key, 0.0) + value
+        return result
+
+    async def render_pdf(self, contents: bytes, max_pages: int) -> list:
+        """Rasterizes each PDF page to a PNG on a worker process."""
+        return await self.submit(self.render_job, contents, PDF_RENDER_DPI, max_pages)
+
+    def stats(self) -> dict:
+        started = self._completed + self._failed + self._timed_out
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": self._running,
+            "queue_depth": max(0, self._pending - self._running),
+            "completed": self._completed,
+            "failed": self._failed,
+            "timed_out": self._timed_out,
+            "crashed": self._crashed,
+            "restarts": self._restarts,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(1000 * self._total_wait / started, 1) if started else 0.0,
+            "max_wait_ms": round(1000 * self._max_wait, 1),
+            "avg_run_ms": round(1000 * self._total_run / self._completed, 1) if self._completed else 0.0,
+            "avg_step_ms": {
+                step: round(total / self._completed, 1) for step, total in self._step_totals.items()
+            } if self._completed else {},
+            "avg_layout": {
+                key: round(total / self._layout_jobs, 1) for key, total in self._layout_totals.items()
+            } if self._layout_jobs else {},
+        }
@@ -0,0 +1,121 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from cache import TTLCache
+from metrics import stage
+
+
+# --- Pharmacy Lookup Configuration ---
+# Geohash precision 7 cells are roughly 150m x 150m, so nearby users share results.
+PHARMACY_CELL_PRECISION = int(os.getenv("PHARMACY_CELL_PRECISION", "7"))
+PHARMACY_RESULTS_TTL_SECONDS = float(os.getenv("PHARMACY_RESULTS_TTL_SECONDS", "900"))
+PHARMACY_DETAILS_TTL_SECONDS = float(os.getenv("PHARMACY_DETAILS_TTL_SECONDS", str(7 * 24 * 3600)))
+PHARMACY_RESULT_LIMIT = 5
+# Maps calls block on the network, so they get their own threads instead of competing with CPU work
+# in the loop's default executor; the semaphore caps how many are in flight across all requests.
+PHARMACY_IO_WORKERS = int(os.getenv("PHARMACY_IO_WORKERS", "32"))
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude: float, longitude: float, precision: int = PHARMACY_CELL_PRECISION) -> str:
+    """Encodes a coordinate as a geohash cell id of `precision` characters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit_count, even, cell = 0, 0, True, []
+    while len(cell) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            bounds[0] = middle
+        else:
+            bits <<= 1
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(cell)
+
+
+class PharmacyFinder:
+    """Finds nearby pharmacies with one long-lived Maps client, concurrent detail lookups and two caches."""
+
+    def __init__(self, api_key: Optional[str], client=None, workers: int = PHARMACY_IO_WORKERS):
+        self.api_key = api_key
+        # Any object with googlemaps.Client's places_nearby and place methods (e.g. fake_backends.FakeMapsClient).
+        self._client = client
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+        self.results = TTLCache(maxsize=2048, ttl=PHARMACY_RESULTS_TTL_SECONDS)
+        self.details = TTLCache(maxsize=8192, ttl=PHARMACY_DETAILS_TTL_SECONDS)
+
+    @property
+    def client(self):
+        # googlemaps.Client keeps a requests.Session, so reusing it keeps connections pooled.
+        # It is imported on first use, so workers that never look up pharmacies don't pay for it.
+        if self._client is None:
+            import googlemaps
+
+            self._client = googlemaps.Client(key=self.api_key)
+        return self._client
+
+    async def _call(self, fn, **kwargs):
+        """Runs a blocking Maps call on the finder's I/O threads, waiting for a free slot first."""
+        async with self._slots:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="maps")
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, **kwargs))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _phone(self, place_id: str) -> str:
+        phone = self.details.get(place_id)
+        if phone is None:
+            with stage("maps_place"):
+                details = await self._call(self.client.place, place_id=place_id, fields=['formatted_phone_number'])
+            phone = details.get('result', {}).get('formatted_phone_number', 'N/A')
+            self.details.set(place_id, phone)
+        return phone
+
+    async def find(self, latitude: float, longitude: float) -> List[dict]:
+        cell = geohash(latitude, longitude)
+        cached = self.results.get(cell)
+        if cached is not None:
+            return cached
+
+        with stage("maps_places_nearby"):
+            places_result = await self._call(
+                self.client.places_nearby,
+                location=(latitude, longitude),
+                keyword='pharmacy',
+                rank_by='distance',
+            )
+        places = [
+            place for place in places_result.get('results', [])[:PHARMACY_RESULT_LIMIT]
+            if place.get('place_id') and place.get('geometry')
+        ]
+        phones = await asyncio.gather(*(self._phone(place['place_id']) for place in places))
+
+        results = [
+            {
+                'name': place.get('name'),
+                'address': place.get('vicinity'),
+                'phone': phone,
+                'geometry': place.get('geometry'),
+            }
+            for place, phone in zip(places, phones)
+        ]
+        self.results.set(cell, results)
+        return results
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "results_cache": self.results.stats(), "details_cache": self.details.stats()}
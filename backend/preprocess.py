@@ -0,0 +1,169 @@
+import io
+import os
+import time
+from dataclasses import dataclass, asdict
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, "1" if default else "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Preprocessing Configuration ---
+@dataclass
+class PreprocessConfig:
+    """Which preprocessing steps run before OCR, and their parameters."""
+    enabled: bool = _env_flag("PREPROCESS_ENABLED", True)
+    draft: bool = _env_flag("PREPROCESS_DRAFT", True)
+    resize: bool = _env_flag("PREPROCESS_RESIZE", True)
+    grayscale: bool = _env_flag("PREPROCESS_GRAYSCALE", True)
+    threshold: bool = _env_flag("PREPROCESS_THRESHOLD", True)
+    deskew: bool = _env_flag("PREPROCESS_DESKEW", True)
+    crop: bool = _env_flag("PREPROCESS_CROP", True)
+    # A phone photo has no real DPI, so we assume the prescription fills the frame width.
+    target_dpi: int = int(os.getenv("PREPROCESS_TARGET_DPI", "300"))
+    page_width_inches: float = float(os.getenv("PREPROCESS_PAGE_WIDTH_INCHES", "6.0"))
+    threshold_block_size: int = int(os.getenv("PREPROCESS_THRESHOLD_BLOCK_SIZE", "31"))
+    threshold_c: int = int(os.getenv("PREPROCESS_THRESHOLD_C", "15"))
+    max_deskew_degrees: float = float(os.getenv("PREPROCESS_MAX_DESKEW_DEGREES", "15"))
+    crop_margin_px: int = int(os.getenv("PREPROCESS_CROP_MARGIN_PX", "20"))
+
+    @property
+    def target_width(self) -> int:
+        return int(self.target_dpi * self.page_width_inches)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _StepTimer:
+    def __init__(self):
+        self.timings = {}
+
+    def step(self, name: str):
+        return _Step(self.timings, name)
+
+
+class _Step:
+    def __init__(self, timings: dict, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = round(1000 * (time.perf_counter() - self.start), 2)
+
+
+# --- Pipeline Steps ---
+def _skew_angle(binary, max_degrees: float) -> float:
+    import cv2
+    import numpy as np
+
+    # Text is dark on a light background; fit a rotated box around the ink.
+    ys, xs = np.where(binary == 0)
+    if len(xs) < 50:
+        return 0.0
+    angle = cv2.minAreaRect(np.column_stack((xs, ys)).astype(np.float32))[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.3 or abs(angle) > max_degrees:
+        return 0.0
+    return float(angle)
+
+
+def _rotate(pixels, angle: float):
+    import cv2
+
+    h, w = pixels.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(pixels, matrix, (w, h), flags=cv2.INTER_NEAREST,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+
+def _text_box(binary, margin: int):
+    import cv2
+    import numpy as np
+
+    # Dilate the ink so characters merge into text blocks, then drop specks before taking the bounding box.
+    inverted = cv2.bitwise_not(binary)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 9))
+    blocks = cv2.dilate(inverted, kernel, iterations=1)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(blocks)
+    min_area = binary.shape[0] * binary.shape[1] * 0.0005
+    boxes = np.array([stats[i] for i in range(1, count) if stats[i][cv2.CC_STAT_AREA] >= min_area])
+    if not len(boxes):
+        return None
+    x0 = max(0, int(boxes[:, cv2.CC_STAT_LEFT].min()) - margin)
+    y0 = max(0, int(boxes[:, cv2.CC_STAT_TOP].min()) - margin)
+    x1 = min(binary.shape[1], int((boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH]).max()) + margin)
+    y1 = min(binary.shape[0], int((boxes[:, cv2.CC_STAT_TOP] + boxes[:, cv2.CC_STAT_HEIGHT]).max()) + margin)
+    return x0, y0, x1, y1
+
+
+def preprocess_image(contents: bytes, config: PreprocessConfig = None):
+    """Decodes and cleans up an uploaded photo for OCR.
+
+    Returns the processed PIL image and a dict of per-step timings in milliseconds.
+    """
+    from PIL import Image
+
+    config = config or PreprocessConfig()
+    timer = _StepTimer()
+
+    with timer.step("decode"):
+        image = Image.open(io.BytesIO(contents))
+        if config.enabled and config.draft and image.format == "JPEG":
+            # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution.
+            width, height = image.size
+            scale = min(1.0, config.target_width / width)
+            image.draft("L" if config.grayscale else "RGB", (int(width * scale), int(height * scale)))
+        image.load()
+
+    if not config.enabled:
+        return image, timer.timings
+
+    # Grayscale first so the resize only has one channel to filter.
+    if config.grayscale or config.threshold or config.deskew or config.crop:
+        with timer.step("grayscale"):
+            image = image.convert("L")
+
+    if config.resize and image.width > config.target_width:
+        with timer.step("resize"):
+            height = int(image.height * config.target_width / image.width)
+            image = image.resize((config.target_width, height), Image.LANCZOS, reducing_gap=2.0)
+
+    if not (config.threshold or config.deskew or config.crop):
+        return image, timer.timings
+
+    import cv2
+    import numpy as np
+
+    pixels = np.asarray(image)
+    with timer.step("threshold"):
+        if config.threshold:
+            block_size = config.threshold_block_size | 1  # must be odd
+            binary = cv2.adaptiveThreshold(pixels, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                           cv2.THRESH_BINARY, block_size, config.threshold_c)
+            pixels = binary
+        else:
+            # Deskew and crop still need a binary mask to find the ink.
+            binary = cv2.threshold(pixels, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+    if config.deskew:
+        with timer.step("deskew"):
+            angle = _skew_angle(binary, config.max_deskew_degrees)
+            if angle:
+                binary = _rotate(binary, angle)
+                pixels = binary if config.threshold else _rotate(pixels, angle)
+
+    if config.crop:
+        with timer.step("crop"):
+            box = _text_box(binary, config.crop_margin_px)
+            if box:
+                x0, y0, x1, y1 = box
+                pixels = pixels[y0:y1, x0:x1]
+
+    return Image.fromarray(pixels), timer.timings
@@ -0,0 +1,358 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from lexicon import AhoCorasick, load_lexicon
+
+
+# --- Rule Extraction Configuration ---
+# Bump RULES_VERSION whenever the rules change, so cached analyses produced by older rules are dropped.
+RULES_VERSION = "4"
+RULE_EXTRACTION_THRESHOLD = float(os.getenv("RULE_EXTRACTION_THRESHOLD", "0.8"))
+
+# Field confidences. A field the rules found explicitly is trusted; a default is not.
+EXPLICIT = 0.95
+DERIVED = 0.85
+CONVENTION = 0.8
+GUESSED = 0.4
+
+_FORMS = {
+    "tab": "Tablet", "tabs": "Tablet", "tablet": "Tablet", "tablets": "Tablet",
+    "cap": "Capsule", "caps": "Capsule", "capsule": "Capsule", "capsules": "Capsule",
+    "syp": "Syrup", "syrup": "Syrup", "susp": "Suspension", "suspension": "Suspension",
+    "inj": "Injection", "injection": "Injection", "oint": "Ointment", "ointment": "Ointment",
+    "cream": "Cream", "gel": "Gel", "drop": "Drops", "drops": "Drops",
+}
+_FORM = re.compile(r"\b(" + "|".join(sorted(_FORMS, key=len, reverse=True)) + r")\b\.?", re.I)
+_DOSE_UNITS = {"Tablet": "tablet", "Capsule": "capsule", "Syrup": "ml", "Suspension": "ml", "Drops": "drops"}
+_QUALIFIERS = {"duo", "forte", "plus", "advance", "sr", "cr", "er", "xl", "ds", "dsr", "mr", "lc", "cv", "sp", "d", "h", "o"}
+_WORD_QUALIFIERS = {"duo", "forte", "plus", "advance"}
+_STRENGTH_TOKEN = re.compile(r"^\d+(\.\d+)?(mg|mcg|g|ml|iu|%)?(/\d+(\.\d+)?(mg|mcg|g|ml)?)?$", re.I)
+_UNIT_TOKEN = re.compile(r"^(mg|mcg|g|ml|iu|%)$", re.I)
+
+# The lookbehind keeps "1/2 tab" from reading as "2 tab"; fractions are matched whole.
+_DOSAGE = re.compile(
+    r"(?<![\w/.])(\d+/\d+|\d+(?:\.\d+)?|½|half|one|two)\s*(tab(?:let)?s?|cap(?:sule)?s?|ml|drops?|puffs?|sachets?|tsp)\b", re.I)
+# A count followed by one of these is a dose ("1/2 tab"), not part of the drug name.
+_COUNT_UNIT = re.compile(r"^(tab(?:let)?s?|cap(?:sule)?s?|drops?|puffs?|sachets?|tsp)\b", re.I)
+# "Zerodol-SP": a hyphenated suffix names a different product than the bare lexicon entry.
+_SUFFIX = re.compile(r"^-([A-Za-z0-9]{1,4})\b")
+# Words OCR read with low confidence are tagged "[?word]" (see ocr_layout.py).
+_LOW_CONFIDENCE = re.compile(r"\[\?[^\]]*\]")
+_DOSE_PATTERN = re.compile(r"(?<![\d.])([0-2½])\s*[-–]\s*([0-2½])\s*[-–]\s*([0-2½])(?:\s*[-–]\s*([0-2½]))?(?![\d.])")
+_FREQUENCY_WORDS = [
+    (re.compile(r"\b(OD|once\s+(a\s+)?da(y|ily))\b", re.I), "once daily"),
+    (re.compile(r"\b(BD|BID|twice\s+(a\s+)?da(y|ily))\b", re.I), "twice daily"),
+    (re.compile(r"\b(TDS|TID|thrice\s+(a\s+)?da(y|ily)|three\s+times\s+(a\s+)?da(y|ily))\b", re.I), "three times daily"),
+    (re.compile(r"\b(QID|four\s+times\s+(a\s+)?da(y|ily))\b", re.I), "four times daily"),
+    (re.compile(r"\b(HS|at\s+bed\s*time)\b", re.I), "at bedtime"),
+    (re.compile(r"\b(SOS|PRN|when\s+required|as\s+needed|if\s+needed)\b", re.I), "when required"),
+]
+_TIMING = [
+    (re.compile(r"\b(empty\s+stomach)\b", re.I), "Take on empty stomach"),
+    (re.compile(r"\b(before\s+(food|meals?|breakfast))\b|\b(AC|B/F|BF)\b"), "Take before food"),
+    (re.compile(r"\b(after\s+(food|meals?|breakfast))\b|\b(PC|A/F|AF)\b"), "Take after food"),
+]
+_DURATION = re.compile(r"(\d+)\s*(days?|weeks?|wks?|months?)\b", re.I)
+_ADVICE = re.compile(r"^\s*(adv(?:ice)?|review|follow[\s-]*up|revisit|diet|note)\b\s*[:.\-]?\s*(.*)$", re.I)
+# Only these are labels to strip; "Review with reports in 7 days" is advice as written.
+_ADVICE_LABELS = {"adv", "advice", "note"}
+_RX = re.compile(r"^\s*(℞|rx\b)[\s.:)\-]*", re.I)
+_TIMES_OF_DAY = ["morning", "afternoon", "night"]
+# Words that carry nothing once the grammar has read a line. Anything else left over ("then",
+# "alternate", "taper", a second dose pattern, free text) means the line says more than the rules
+# understood, so it goes to the model.
+_FILLER = {"x", "for", "take", "and", "a", "the", "to", "of", "daily", "with", "water", "orally", "po"}
+_NUMBERING = re.compile(r"^\s*\d{1,2}\s*[.)]")
+
+
+def _leftover(text: str, spans: List[Tuple[int, int]], skip: int = 0) -> str:
+    """The meaningful words of `text` outside `spans` and its first `skip` characters, or ''."""
+    kept = list(text)
+    for start, end in spans + [(0, skip)]:
+        kept[start:end] = " " * (end - start)
+    words = re.findall(r"[A-Za-z]+|\d+(?:\.\d+)?", _NUMBERING.sub(" ", "".join(kept)))
+    return " ".join(word for word in words if word.lower() not in _FILLER and word.lower() not in _FORMS)
+
+
+@dataclass
+class _MedicationLine:
+    lines: List[str]
+    name: str
+    name_confidence: float
+    form: Optional[str]
+    dosage: Optional[str] = None
+    dosage_confidence: float = GUESSED
+    frequency: Optional[str] = None
+    timing: Optional[str] = None
+    dose_count: Optional[str] = None
+    duration_days: Optional[int] = None
+    frequency_confidence: float = EXPLICIT
+    timing_confidence: float = EXPLICIT
+    duration_confidence: float = EXPLICIT
+    # Words of this medication's lines that no grammar accounted for.
+    unparsed: List[str] = field(default_factory=list)
+
+    def absorb(self, line: str, skip: int = 0):
+        """Reads dosage, frequency, timing and duration from text belonging to this medication.
+
+        A field read from a low-confidence "[?...]" word is only GUESSED, whatever the pattern.
+        The first `skip` characters were already read as the name (though "Benadryl 10 ml" is also
+        a dosage, so every grammar still searches the whole line). A field that is already set
+        only accounts for a repeat of the same value; a different one is left unparsed.
+        """
+        low = [match.span() for match in _LOW_CONFIDENCE.finditer(line)]
+        consumed: List[Tuple[int, int]] = []
+
+        def confidence(match) -> float:
+            return GUESSED if any(start < match.end() and match.start() < end for start, end in low) else EXPLICIT
+
+        match = _DOSAGE.search(line)
+        if match:
+            count, unit = match.group(1), match.group(2).lower()
+            unit = "tablet" if unit.startswith("tab") else "capsule" if unit.startswith("cap") else unit.rstrip("s")
+            count = {"half": "½", "one": "1", "two": "2", "1/2": "½"}.get(count.lower(), count)
+            singular = count in ("1", "½") or "/" in count or unit == "ml"
+            dosage = f"{count} {unit}" if singular else f"{count} {unit}s"
+            if self.dosage is None:
+                self.dosage, self.dosage_confidence = dosage, confidence(match)
+            if self.dosage == dosage:
+                consumed.append(match.span())
+
+        match = _DOSE_PATTERN.search(line)
+        if match:
+            doses = [dose for dose in match.groups() if dose is not None]
+            taken = [_TIMES_OF_DAY[i] if len(doses) == 3 else f"dose {i + 1}" for i, dose in enumerate(doses) if dose != "0"]
+            frequency = {1: "once daily", 2: "twice daily", 3: "three times daily", 4: "four times daily"}.get(len(taken), "daily")
+            if len(doses) == 3 and taken:
+                frequency += f" ({' and '.join(taken)})"
+            if self.frequency is None:
+                self.frequency, self.frequency_confidence = frequency, confidence(match)
+                self.dose_count = max(doses)
+            if self.frequency == frequency:
+                consumed.append(match.span())
+        for pattern, frequency in _FREQUENCY_WORDS:
+            match = pattern.search(line)
+            if match:
+                if self.frequency is None:
+                    self.frequency, self.frequency_confidence = frequency, confidence(match)
+                # "1-0-1 BD" repeats itself; "1-0-1 SOS" does not.
+                if self.frequency.startswith(frequency):
+                    consumed.append(match.span())
+        for pattern, timing in _TIMING:
+            match = pattern.search(line)
+            if match:
+                if self.timing is None:
+                    self.timing, self.timing_confidence = timing, confidence(match)
+                if self.timing == timing:
+                    consumed.append(match.span())
+
+        match = _DURATION.search(line)
+        if match:
+            count, unit = int(match.group(1)), match.group(2).lower()
+            duration_days = count * (7 if unit.startswith("w") else 30 if unit.startswith("m") else 1)
+            if self.duration_days is None:
+                self.duration_days, self.duration_confidence = duration_days, confidence(match)
+            if self.duration_days == duration_days:
+                consumed.append(match.span())
+
+        leftover = _leftover(_LOW_CONFIDENCE.sub(lambda tag: tag.group().replace("[?", "  ").replace("]", " "), line),
+                             consumed, skip)
+        if leftover:
+            self.unparsed.append(leftover)
+
+    def to_medication(self) -> dict:
+        dosage, dosage_confidence = self.dosage, self.dosage_confidence
+        if dosage is None and self.form in ("Tablet", "Capsule"):
+            # "Tab X 1-0-1" means one tablet per dose; with no dose pattern at all, one unit is the convention.
+            count = self.dose_count or "1"
+            unit = _DOSE_UNITS[self.form]
+            dosage = f"{count} {unit}" if count in ("1", "½") else f"{count} {unit}s"
+            dosage_confidence = DERIVED if self.dose_count else CONVENTION
+            if self.dose_count:
+                dosage_confidence = min(dosage_confidence, self.frequency_confidence)
+
+        duration_days, duration_confidence = self.duration_days, self.duration_confidence
+        if duration_days is None:
+            # As-needed medicines have no course length; the analysis prompt records those as 1 day.
+            duration_days = 1
+            duration_confidence = CONVENTION if self.frequency == "when required" else GUESSED
+
+        parts = [part for part in (self.timing, self.frequency) if part]
+        instruction = ", ".join(parts)
+        if instruction and self.duration_days:
+            instruction += f" for {self.duration_days} days"
+        if instruction and not self.timing:
+            instruction = "Take " + instruction
+
+        return {
+            "medication": {
+                "name": self.name,
+                "dosage": dosage or "N/A",
+                "instruction": instruction or "N/A",
+                "duration_days": duration_days,
+            },
+            "confidence": {
+                "name": self.name_confidence,
+                "dosage": dosage_confidence if dosage else GUESSED,
+                # Words the rules skipped may change the instruction ("then 0-0-1 x 5 days", "alternate days").
+                "instruction": (min(self.frequency_confidence, self.timing_confidence)
+                                if self.frequency and not self.unparsed else GUESSED),
+                "duration_days": duration_confidence,
+            },
+        }
+
+
+def _has_instructions(line: str) -> bool:
+    return bool(_DOSE_PATTERN.search(line) or _DURATION.search(line)
+                or any(pattern.search(line) for pattern, _ in _FREQUENCY_WORDS + _TIMING))
+
+
+@dataclass
+class RuleExtraction:
+    medications: List[dict] = field(default_factory=list)
+    confidences: List[dict] = field(default_factory=list)
+    advice: str = "N/A"
+    advice_confidence: float = GUESSED
+    uncertain_lines: List[str] = field(default_factory=list)
+
+    def confident_medications(self, threshold: float = RULE_EXTRACTION_THRESHOLD) -> List[dict]:
+        return [med for med, confidence in zip(self.medications, self.confidences)
+                if min(confidence.values()) >= threshold]
+
+    def is_confident(self, threshold: float = RULE_EXTRACTION_THRESHOLD) -> bool:
+        """True when every field of every medication, and the advice, clears the threshold."""
+        return (bool(self.medications) and not self.uncertain_lines and self.advice_confidence >= threshold
+                and len(self.confident_medications(threshold)) == len(self.medications))
+
+    def to_analysis(self) -> dict:
+        return {"medications": self.medications, "advice": self.advice}
+
+
+class RuleExtractor:
+    """Extracts routine prescriptions locally with a drug lexicon and regex grammars.
+
+    Every field gets a confidence score; callers send only the lines the rules are unsure about to the LLM.
+    """
+
+    def __init__(self, terms: Optional[List[str]] = None, threshold: float = RULE_EXTRACTION_THRESHOLD):
+        self.terms = terms if terms is not None else load_lexicon()
+        self.matcher = AhoCorasick(self.terms)
+        self._canonical = {term.lower(): term for term in self.terms}
+        self.threshold = threshold
+        self.local = 0
+        self.partial = 0
+        self.llm_only = 0
+
+    def _name(self, line: str, match_end: int, term: str, form: Optional[str]) -> Tuple[str, bool, int]:
+        """Builds a display name like 'Augmentin 625 Duo Tablet' from the lexicon match and what follows it.
+
+        Also returns whether any part of the name after the lexicon match was a low-confidence word,
+        and how many characters after the match the name used.
+        """
+        parts = [self._canonical[term.lower()]]
+        rest = line[match_end:]
+        used = 0
+        suffix = _SUFFIX.match(rest)
+        if suffix:
+            parts[0] += "-" + suffix.group(1).upper()
+            used = suffix.end()
+        tokens = [(token.group(), token.end()) for token in re.finditer(r"\S+", rest[used:])]
+        offset = used
+        seen_strength, unsure = False, False
+        for index, (token, token_end) in enumerate(tokens):
+            bare = token.strip(",;:()[]?")
+            following = tokens[index + 1][0] if index + 1 < len(tokens) else ""
+            if _COUNT_UNIT.match(following.strip(",;:()[]?")):
+                break
+            if _STRENGTH_TOKEN.match(bare) and not seen_strength:
+                parts.append(bare)
+                seen_strength = True
+            elif _UNIT_TOKEN.match(bare) and seen_strength:
+                parts[-1] += bare
+            elif bare.lower() in _QUALIFIERS:
+                parts.append(bare.capitalize() if bare.lower() in _WORD_QUALIFIERS else bare.upper())
+            else:
+                break
+            unsure = unsure or token.startswith("[?")
+            used = offset + token_end
+        if form:
+            parts.append(form)
+        return " ".join(parts), unsure, used
+
+    def extract(self, text: str) -> RuleExtraction:
+        result = RuleExtraction()
+        current: Optional[_MedicationLine] = None
+        found: List[_MedicationLine] = []
+        advice, unclassified = [], []
+        after_rx = False
+
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            rx = _RX.match(line)
+            if rx:
+                after_rx = True
+                line = line[rx.end():]
+            if sum(char.isalnum() for char in line) < 3:
+                continue
+
+            advice_match = _ADVICE.match(line)
+            if advice_match:
+                label = advice_match.group(1).lower()
+                advice.append((advice_match.group(2).strip() if label in _ADVICE_LABELS else "") or line)
+                current = None
+                continue
+
+            matches = self.matcher.find(line)
+            form_match = _FORM.search(line)
+            form = _FORMS[form_match.group(1).lower()] if form_match else None
+            if matches:
+                start, end, term = matches[0]
+                # "[?Crocin]" is a name OCR was unsure of; the model gets to judge it.
+                name, name_unsure, used = self._name(line, end, term, form)
+                name_confidence = GUESSED if line[max(0, start - 2):start] == "[?" or name_unsure else EXPLICIT
+                current = _MedicationLine(lines=[line], name=name, name_confidence=name_confidence, form=form)
+                # Before the name only numbering and the form are expected.
+                prefix = _leftover(line[:start].replace("[?", "  "), [])
+                if prefix:
+                    current.unparsed.append(prefix)
+                current.absorb(line[end:], skip=used)
+                found.append(current)
+            elif form_match and form_match.start() < 3:
+                # Looks like a medication line, but the drug is not in the lexicon.
+                current = _MedicationLine(lines=[line], name=line, name_confidence=0.0, form=form)
+                found.append(current)
+            elif current is not None and _has_instructions(line):
+                # Instructions continued on the line below the drug name.
+                current.lines.append(line)
+                current.absorb(line)
+            elif found or after_rx or _has_instructions(line):
+                # A drug the lexicon doesn't know can come first; it must reach the model, not be dropped.
+                unclassified.append(line)
+                current = None
+            # Other lines before the first medication are the letterhead and patient details.
+
+        for med in found:
+            extracted = med.to_medication()
+            result.medications.append(extracted["medication"])
+            result.confidences.append(extracted["confidence"])
+            if min(extracted["confidence"].values()) < self.threshold:
+                result.uncertain_lines.extend(med.lines)
+
+        result.uncertain_lines.extend(unclassified)
+        if advice:
+            result.advice, result.advice_confidence = " ".join(advice), EXPLICIT
+        elif not unclassified:
+            result.advice_confidence = DERIVED
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "lexicon_size": len(self.terms),
+            "threshold": self.threshold,
+            "local": self.local,
+            "partial": self.partial,
+            "llm_only": self.llm_only,
+        }
+
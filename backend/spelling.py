@@ -0,0 +1,308 @@
+import os
+import pickle
+import re
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import sha256_hex
+from lexicon import DRUG_LEXICON_PATH, LEXICON_DIR, load_lexicon
+
+
+# --- Spelling Correction Configuration ---
+MEDICAL_VOCABULARY_PATH = LEXICON_DIR / "medical_vocabulary.txt"
+# Ordinary English: accepted as spelled right, never offered as a correction.
+ENGLISH_WORDS_PATH = LEXICON_DIR / "english_words.txt"
+VOCABULARY_PATHS = (DRUG_LEXICON_PATH, MEDICAL_VOCABULARY_PATH)
+SPELLING_INDEX_PATH = Path(os.getenv("SPELLING_INDEX_PATH", str(LEXICON_DIR / "spelling_index.bin")))
+SPELLING_MIN_CONFIDENCE = float(os.getenv("SPELLING_MIN_CONFIDENCE", "0.6"))
+# Bump INDEX_FORMAT whenever the index layout or the cost model changes; stale index files are rebuilt.
+INDEX_FORMAT = 1
+MAX_EDIT_DISTANCE = 2
+MIN_WORD_LENGTH = 3
+
+# OCR-aware edit costs: swapping look-alike glyphs is much cheaper than an arbitrary typo.
+CONFUSABLE_COST = 0.3
+SPLIT_COST = 0.4
+_CONFUSABLE = {pair for a, b in [
+    ("l", "i"), ("l", "1"), ("i", "1"), ("l", "|"), ("i", "|"), ("o", "0"), ("s", "5"), ("b", "8"),
+    ("g", "9"), ("z", "2"), ("e", "c"), ("c", "o"), ("n", "h"), ("u", "v"), ("a", "o"), ("t", "f"),
+] for pair in ((a, b), (b, a))}
+# One glyph read as two (or two as one), in both directions.
+_SPLITS = {pair for two, one in [("rn", "m"), ("cl", "d"), ("vv", "w"), ("ii", "u"), ("li", "h"), ("ri", "n")]
+           for pair in ((two, one), (one, two))}
+
+_TOKEN = re.compile(r"[A-Za-z0-9|]+")
+# Strengths glued onto a name ("Dolo650", "Pan40mg") are kept as they are and only the name is checked.
+_GLUED_STRENGTH = re.compile(r"^(.*?)(\d{2,}(?:\.\d+)?(?:mg|mcg|g|ml|iu)?)?$", re.I)
+# "drinks", "tired", "feeling": inflections of a known word are known too.
+_INFLECTIONS = ("ing", "ed", "es", "s", "d", "ly")
+
+
+def ocr_edit_cost(observed: str, word: str, limit: float = float("inf")) -> float:
+    """Weighted Damerau-Levenshtein distance with cheap substitutions for OCR look-alikes (l/I/1, 0/O, rn/m, ...).
+
+    Gives up and returns infinity as soon as the cost is sure to exceed `limit`.
+    """
+    n, m = len(observed), len(word)
+    # Each character of length difference costs at least a split (one glyph read as two).
+    if abs(n - m) * SPLIT_COST > limit:
+        return float("inf")
+    d = [[float(j) for j in range(m + 1)]] + [[float(i)] + [0.0] * m for i in range(1, n + 1)]
+    for i in range(1, n + 1):
+        a = observed[i - 1]
+        pair = observed[i - 2:i] if i > 1 else ""
+        row, above = d[i], d[i - 1]
+        for j in range(1, m + 1):
+            b = word[j - 1]
+            if a == b:
+                substitution = 0.0
+            else:
+                substitution = CONFUSABLE_COST if (a, b) in _CONFUSABLE else 1.0
+            best = min(above[j] + 1, row[j - 1] + 1, above[j - 1] + substitution)
+            if i > 1 and j > 1 and a == word[j - 2] and observed[i - 2] == b:
+                best = min(best, d[i - 2][j - 2] + 1)
+            if pair and (pair, b) in _SPLITS:
+                best = min(best, d[i - 2][j - 1] + SPLIT_COST)
+            if j > 1 and (a, word[j - 2:j]) in _SPLITS:
+                best = min(best, above[j - 2] + SPLIT_COST)
+            row[j] = best
+        # Every later cell builds on the last two rows, so once both are over the limit the total is too.
+        if min(row) > limit and min(above) > limit:
+            return float("inf")
+    return d[n][m]
+
+
+def _deletes(word: str, max_distance: int = MAX_EDIT_DISTANCE) -> set:
+    """The word plus every string obtained by deleting up to `max_distance` characters from it."""
+    found, frontier = {word}, {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def _max_cost(length: int) -> float:
+    # Short words only get look-alike fixes; a real edit would turn them into a different word too easily.
+    if length <= 4:
+        return 0.99
+    return 1.5 if length <= 7 else 2.0
+
+
+def _match_case(original: str, word: str, display: str) -> str:
+    """Spells `word` the way the original token was written; falls back to the vocabulary's own spelling."""
+    letters = [char for char in original if char.isalpha()]
+    if letters and sum(char.isupper() for char in letters) > len(letters) / 2:
+        return word.upper()
+    if original[0].isupper():
+        return word.capitalize()
+    if original[0].islower():
+        return word
+    return display
+
+
+def vocabulary_words(paths: Iterable[Path] = VOCABULARY_PATHS) -> List[str]:
+    """Distinct words of the lexicon files as first written there, in file order."""
+    words: Dict[str, str] = {}
+    for path in paths:
+        for term in load_lexicon(path):
+            for word in re.findall(r"[A-Za-z]+", term):
+                if len(word) >= MIN_WORD_LENGTH:
+                    words.setdefault(word.lower(), word)
+    return list(words.values())
+
+
+def english_words(path: Path = ENGLISH_WORDS_PATH) -> frozenset:
+    return frozenset(word.lower() for line in load_lexicon(path) for word in re.findall(r"[A-Za-z]+", line))
+
+
+def vocabulary_hash(paths: Iterable[Path] = VOCABULARY_PATHS + (ENGLISH_WORDS_PATH,)) -> str:
+    contents = [Path(path).read_text(encoding="utf-8") for path in paths]
+    return sha256_hex(str(INDEX_FORMAT), str(MAX_EDIT_DISTANCE), *contents)[:16]
+
+
+class SpellingIndex:
+    """A SymSpell delete index: every word is stored under each of its deletions, so a lookup only probes dict keys."""
+
+    def __init__(self, words: List[str], deletes: Dict[str, Tuple[int, ...]], source_hash: str):
+        self.display = words
+        self.words = [word.lower() for word in words]
+        self.word_set = frozenset(self.words)
+        self.deletes = deletes
+        self.source_hash = source_hash
+
+    @classmethod
+    def build(cls, words: List[str], source_hash: str) -> "SpellingIndex":
+        deletes: Dict[str, List[int]] = {}
+        for index, word in enumerate(words):
+            for variant in _deletes(word.lower()):
+                deletes.setdefault(variant, []).append(index)
+        return cls(words, {key: tuple(value) for key, value in deletes.items()}, source_hash)
+
+    def save(self, path: Path):
+        payload = {"format": INDEX_FORMAT, "source_hash": self.source_hash, "words": self.display, "deletes": self.deletes}
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, source_hash: str) -> Optional["SpellingIndex"]:
+        """Reads an index written by `save`; returns None if it is missing or was built from other sources."""
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if payload.get("format") != INDEX_FORMAT or payload.get("source_hash") != source_hash:
+            return None
+        return cls(payload["words"], payload["deletes"], source_hash)
+
+    def candidates(self, token: str) -> set:
+        found = set()
+        for variant in _deletes(token):
+            found.update(self.deletes.get(variant, ()))
+        return found
+
+
+@dataclass
+class Correction:
+    original: str
+    correction: str
+    start: int
+    end: int
+    confidence: float
+    applied: bool
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class SpellingCorrector:
+    """Fixes OCR misspellings of drug names and prescription vocabulary before the text is analyzed.
+
+    Each correction gets a confidence from its OCR-aware edit cost and from how far ahead it is of the
+    next best candidate; only corrections at or above `min_confidence` are applied to the text.
+    """
+
+    def __init__(self, index: SpellingIndex, min_confidence: float = SPELLING_MIN_CONFIDENCE,
+                 known_words: frozenset = frozenset()):
+        self.index = index
+        self.min_confidence = min_confidence
+        self.known_words = index.word_set | known_words
+        self.source = "built"
+        self.load_ms = 0.0
+        self.tokens = 0
+        self.corrected = 0
+        self.rejected = 0
+        self._check = lru_cache(maxsize=50000)(self._check_token)
+
+    @classmethod
+    def load(cls, path: Path = SPELLING_INDEX_PATH, min_confidence: float = SPELLING_MIN_CONFIDENCE) -> "SpellingCorrector":
+        """Loads the prebuilt index file, rebuilding (and rewriting) it if the vocabulary files changed."""
+        start = time.perf_counter()
+        source_hash = vocabulary_hash()
+        index = SpellingIndex.load(path, source_hash)
+        source = "file"
+        if index is None:
+            index = SpellingIndex.build(vocabulary_words(), source_hash)
+            source = "built"
+            try:
+                index.save(path)
+            except OSError as e:
+                print(f"WARNING: Could not write spelling index to {path}: {e}")
+        corrector = cls(index, min_confidence, english_words())
+        corrector.source = source
+        corrector.load_ms = (time.perf_counter() - start) * 1000
+        return corrector
+
+    @property
+    def version(self) -> str:
+        return f"{self.index.source_hash}:{self.min_confidence}"
+
+    def _check_token(self, token: str) -> Optional[Tuple[str, str, float]]:
+        """Returns (misspelled part, replacement, confidence) for a raw token, or None if it needs no correction."""
+        core = _GLUED_STRENGTH.match(token).group(1)
+        if len(core) < MIN_WORD_LENGTH or sum(char.isalpha() for char in core) < 2:
+            return None
+        lowered = core.lower()
+        if self._is_known(lowered):
+            return None
+        found = self._best_match(lowered)
+        if found is None:
+            return None
+        index, confidence = found
+        return core, _match_case(core, self.index.words[index], self.index.display[index]), confidence
+
+    def _is_known(self, word: str) -> bool:
+        if word in self.known_words:
+            return True
+        return any(word.endswith(ending) and word[:-len(ending)] in self.known_words
+                   for ending in _INFLECTIONS if len(word) - len(ending) >= MIN_WORD_LENGTH)
+
+    def _best_match(self, token: str) -> Optional[Tuple[int, float]]:
+        """Returns (word index, confidence) for a lowercase token that is not in the vocabulary, or None."""
+        max_cost = _max_cost(len(token))
+        scored = []
+        for index in self.index.candidates(token):
+            word = self.index.words[index]
+            cost = ocr_edit_cost(token, word, max_cost)
+            if cost <= max_cost:
+                scored.append((cost, index, word))
+        if not scored:
+            return None
+        scored.sort()
+        cost, index, word = scored[0]
+        similarity = max(0.0, 1 - cost / max(len(token), len(word)))
+        if len(scored) > 1:
+            runner_up = scored[1][0]
+            margin = (runner_up - cost) / runner_up if runner_up else 0.0
+        else:
+            margin = 1.0
+        return index, round(similarity * (0.5 + 0.5 * margin), 3)
+
+    def correct(self, text: str) -> Tuple[str, List[Correction]]:
+        """Returns the corrected text and every correction considered, applied or not."""
+        pieces, corrections, position = [], [], 0
+        for match in _TOKEN.finditer(text):
+            self.tokens += 1
+            found = self._check(match.group())
+            if found is None:
+                continue
+            core, replacement, confidence = found
+            applied = confidence >= self.min_confidence
+            start, end = match.start(), match.start() + len(core)
+            corrections.append(Correction(core, replacement, start, end, confidence, applied))
+            if applied:
+                self.corrected += 1
+                pieces.append(text[position:start])
+                pieces.append(replacement)
+                position = end
+            else:
+                self.rejected += 1
+        pieces.append(text[position:])
+        return "".join(pieces), corrections
+
+    def stats(self) -> dict:
+        cache = self._check.cache_info()
+        return {
+            "source": self.source,
+            "load_ms": round(self.load_ms, 2),
+            "words": len(self.index.words),
+            "index_keys": len(self.index.deletes),
+            "min_confidence": self.min_confidence,
+            "tokens": self.tokens,
+            "corrected": self.corrected,
+            "rejected": self.rejected,
+            "lookup_cache_hits": cache.hits,
+            "lookup_cache_misses": cache.misses,
+        }
+
+
+if __name__ == "__main__":
+    # Prebuilds the index file, e.g. during a container build: python spelling.py
+    built = SpellingIndex.build(vocabulary_words(), vocabulary_hash())
+    built.save(SPELLING_INDEX_PATH)
+    print(f"Wrote {len(built.words)} words and {len(built.deletes)} index keys to {SPELLING_INDEX_PATH}.")
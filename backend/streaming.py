@@ -0,0 +1,88 @@
+import json
+from typing import Any, List, Tuple
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def chunk_text(chunk) -> str:
+    """Returns the text of a streamed message chunk, whose content may be a string or a list of parts."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class JSONSectionParser:
+    """Incrementally scans a streamed JSON object and yields each top-level value once it is complete.
+
+    Feed it the model's output as it arrives; `feed` returns the (key, value) pairs that
+    finished in that chunk. Markdown fences or chatter before the opening brace are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buffer += text
+        sections = []
+        while self._pos < len(self._buffer) and not self.done:
+            char = self._buffer[self._pos]
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._value_start is None:
+                        self._key = json.loads(self._buffer[self._key_start:self._pos + 1])
+                self._pos += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = self._pos
+            elif char == ":" and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = self._pos + 1
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(sections, self._pos)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                self._emit(sections, self._pos)
+            self._pos += 1
+        return sections
+
+    def _emit(self, sections: list, end: int):
+        if self._key is not None and self._value_start is not None:
+            raw = self._buffer[self._value_start:end].strip()
+            try:
+                sections.append((self._key, json.loads(raw)))
+            except json.JSONDecodeError:
+                pass
+        self._key = None
+        self._key_start = None
+        self._value_start = None
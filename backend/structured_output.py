@@ -0,0 +1,310 @@
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel, RootModel, ValidationError, field_validator
+
+from metrics import stage
+
+
+# --- Structured Output Configuration ---
+# Re-prompts are the last resort after local repair; each one is a full (if short) model call.
+STRUCTURED_MAX_REPROMPTS = int(os.getenv("STRUCTURED_MAX_REPROMPTS", "1"))
+
+REPROMPT_TEMPLATE = """Your previous reply could not be used: {error}
+Reply again with only the corrected JSON, matching the requested format exactly."""
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a reply cannot be turned into the expected shape, even after repair and re-prompting."""
+
+
+# --- Output Models ---
+def _as_text(value: Any) -> Any:
+    if value is None:
+        return "N/A"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+class Medication(BaseModel):
+    # Every field is required: a reply cut off inside a medication must fail validation and be
+    # re-prompted, not be repaired into a defaulted entry. An explicit null is still accepted.
+    name: str
+    dosage: str
+    instruction: str
+    duration_days: int
+
+    @field_validator("name", "dosage", "instruction", mode="before")
+    @classmethod
+    def _text(cls, value):
+        return _as_text(value)
+
+    @field_validator("duration_days", mode="before")
+    @classmethod
+    def _days(cls, value):
+        # The prompt asks for an integer, but "5 days" and "5" both turn up.
+        if isinstance(value, str):
+            match = re.search(r"\d+", value)
+            return int(match.group()) if match else 1
+        return 1 if value is None else value
+
+
+class Analysis(BaseModel):
+    medications: List[Medication]
+    advice: str
+
+    @field_validator("advice", mode="before")
+    @classmethod
+    def _text(cls, value):
+        if isinstance(value, list):
+            return " ".join(str(item) for item in value)
+        return _as_text(value)
+
+
+class DrugInfo(BaseModel):
+    name: str
+    purpose: str = ""
+    health_tips: List[str] = []
+    food_interactions: List[str] = []
+
+
+class DrugInfoBatch(BaseModel):
+    drugs: List[DrugInfo] = []
+    summary: str = ""
+
+
+class Translation(RootModel[List[str]]):
+    pass
+
+
+# --- Local JSON Repair ---
+_FENCE = re.compile(r"```(?:json)?", re.I)
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _normalize(text: str) -> Tuple[str, List[str], bool, List[int], List[int]]:
+    """Rewrites single-quoted strings and Python literals as JSON and drops trailing commas.
+
+    Returns the rewritten text, the brackets still open at its end, whether it ends inside a string,
+    and the positions of the commas outside strings and of the still-open brackets in the rewritten text.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    opened: List[int] = []
+    commas: List[int] = []
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\" and i + 1 < len(text):
+                escaped = text[i + 1]
+                out.append(escaped if (quote == "'" and escaped == "'") else char + escaped)
+                i += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            opened.append(len(out))
+            out.append(char)
+        elif char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                commas.pop()
+            if stack:
+                stack.pop()
+                opened.pop()
+            out.append(char)
+        elif char == ",":
+            commas.append(len(out))
+            out.append(char)
+        elif char.isalpha():
+            match = re.match(r"[A-Za-z]+", text[i:])
+            word = match.group()
+            out.append(_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out), stack, quote is not None, commas, opened
+
+
+# A key whose value was cut off, with the comma before it.
+_DANGLING_KEY = re.compile(r'\s*,?\s*"(?:[^"\\]|\\.)*"\s*:$')
+
+
+def _close(text: str, stack: List[str], in_string: bool) -> str:
+    closed = text + ('"' if in_string else "")
+    closed = closed.rstrip()
+    if closed.endswith(","):
+        closed = closed[:-1]
+    elif closed.endswith(":"):
+        # Dropped rather than set to null: null passes for "N/A" and would hide the cut.
+        closed = _DANGLING_KEY.sub("", closed)
+    return closed + "".join(reversed(stack))
+
+
+def repair_json(reply: str) -> Tuple[Any, bool]:
+    """Parses a model reply as JSON, repairing common defects locally.
+
+    Handles markdown fences, text before or after the JSON, single quotes, Python literals,
+    trailing commas and replies cut off mid-way (the incomplete last item is dropped, but an
+    object cut off mid-way is kept with only its complete fields, so a schema with required
+    fields rejects it).
+    Returns (value, repaired); raises ValueError if nothing usable is found.
+    """
+    text = _FENCE.sub("", reply).strip()
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        raise ValueError("Reply contains no JSON object or array.")
+    text = text[min(starts):]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value, True
+    except json.JSONDecodeError:
+        pass
+
+    normalized, stack, in_string, commas, opened = _normalize(text)
+    candidate = normalized
+    if in_string and (commas or opened):
+        # A string cut off mid-way would pass for a complete value, so drop it, but no further
+        # back than the bracket it is in: a half-written object must not vanish as a whole.
+        inner = opened[-1] + 1 if opened else 0
+        cut = commas.pop() if commas and commas[-1] > inner else inner
+        candidate = normalized[:cut]
+        _, stack, in_string, _, _ = _normalize(candidate)
+    while True:
+        try:
+            value, _ = json.JSONDecoder().raw_decode(_close(candidate, stack, in_string))
+            return value, True
+        except json.JSONDecodeError as e:
+            if not commas:
+                raise ValueError(f"Reply is not valid JSON: {e}")
+        # Cut back to the last complete item and close whatever is still open there.
+        cut = commas.pop()
+        candidate = normalized[:cut]
+        _, stack, in_string, _, _ = _normalize(candidate)
+
+
+def supports_json_mode(llm: Any) -> bool:
+    """True for chat models that accept response_mime_type (Gemini does)."""
+    return "response_mime_type" in getattr(type(llm), "model_fields", {})
+
+
+# --- Structured Output Layer ---
+M = TypeVar("M", bound=BaseModel)
+
+
+class StructuredOutput:
+    """Gets replies of a known shape from the model.
+
+    Asks for JSON mode with the model's schema when supported, validates the reply with Pydantic,
+    repairs common JSON defects locally, and only re-prompts, with just the validation error,
+    when the reply still cannot be used.
+    """
+
+    def __init__(self, llm_client, json_mode: Union[bool, Callable[[], bool]] = False,
+                 max_reprompts: int = STRUCTURED_MAX_REPROMPTS):
+        self.llm_client = llm_client
+        # A callable is resolved on first use, so the model doesn't have to be built just to ask.
+        self._json_mode = json_mode
+        self.max_reprompts = max_reprompts
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def json_mode(self) -> bool:
+        if callable(self._json_mode):
+            self._json_mode = bool(self._json_mode())
+        return self._json_mode
+
+    def _count(self, name: str, counter: str):
+        counts = self.counters.setdefault(name, {"requests": 0, "clean": 0, "repaired": 0, "reprompts": 0, "failures": 0})
+        counts[counter] += 1
+
+    def options(self, model: Type[BaseModel]) -> dict:
+        """Generation settings that constrain the reply to `model`'s JSON schema, if the model supports it."""
+        if not self.json_mode:
+            return {}
+        return {"response_mime_type": "application/json", "response_json_schema": model.model_json_schema()}
+
+    @staticmethod
+    def _parse(reply: str, model: Type[M], check: Optional[Callable[[M], None]]) -> Tuple[M, bool]:
+        with stage("json_parse"):
+            value, repaired = repair_json(reply)
+        try:
+            with stage("json_validate"):
+                parsed = model.model_validate(value)
+        except ValidationError as e:
+            raise ValueError(f"The JSON does not match the required format: {e.errors(include_url=False)}")
+        if check is not None:
+            check(parsed)
+        return parsed, repaired
+
+    async def generate(self, name: str, prompt: str, model: Type[M], check: Optional[Callable[[M], None]] = None) -> M:
+        """Returns the reply to `prompt` validated as `model`.
+
+        `check` may raise ValueError for problems the schema cannot express (e.g. a wrong item count);
+        those are handled like validation errors.
+        """
+        # Imported here rather than at module load; by the time a model is called, LangChain is loaded anyway.
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        self._count(name, "requests")
+        options = self.options(model)
+        messages: List[Any] = [HumanMessage(content=prompt)]
+        response = await self.llm_client.ainvoke(prompt, **options)
+        for attempt in range(self.max_reprompts + 1):
+            reply = response.content if isinstance(response.content, str) else str(response.content)
+            try:
+                parsed, repaired = self._parse(reply, model, check)
+                self._count(name, "repaired" if repaired else "clean")
+                return parsed
+            except ValueError as e:
+                error = str(e)
+            if attempt == self.max_reprompts:
+                break
+            self._count(name, "reprompts")
+            print(f"WARNING: Re-prompting {name} after an unusable reply: {error}")
+            messages += [AIMessage(content=reply), HumanMessage(content=REPROMPT_TEMPLATE.format(error=error))]
+            response = await self.llm_client.ainvoke(messages, **options)
+
+        self._count(name, "failures")
+        print(f"AI response that failed to parse:\n{reply}")
+        raise StructuredOutputError(f"Could not get valid {name} output from the model: {error}")
+
+    def parse(self, name: str, reply: str, model: Type[M]) -> M:
+        """Validates a reply that was already received, such as a finished stream; never re-prompts."""
+        self._count(name, "requests")
+        try:
+            parsed, repaired = self._parse(reply, model, None)
+        except ValueError as e:
+            self._count(name, "failures")
+            raise StructuredOutputError(f"Could not get valid {name} output from the model: {e}")
+        self._count(name, "repaired" if repaired else "clean")
+        return parsed
+
+    def stats(self) -> dict:
+        json_mode = None if callable(self._json_mode) else self._json_mode
+        return {"json_mode": json_mode, "max_reprompts": self.max_reprompts, **self.counters}
@@ -0,0 +1,19 @@
+import time
+
+from cache import SQLiteCache, TieredCache
+
+
+def test_disk_tier_uses_the_cache_ttl(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    TieredCache("drug_info", "v1", disk, ttl=30 * 24 * 3600).set("crocin", {"purpose": "fever"})
+    expires_at = disk._conn.execute("SELECT expires_at FROM cache WHERE key = ?", ("crocin",)).fetchone()[0]
+    assert expires_at > time.time() + 29 * 24 * 3600
+
+
+def test_memory_ttl_leaves_the_disk_default(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite3"), ttl=7 * 24 * 3600)
+    cache = TieredCache("analysis_text", "v1", disk, memory_ttl=3600)
+    cache.set("text", {"medications": []})
+    assert cache.memory.ttl == 3600
+    expires_at = disk._conn.execute("SELECT expires_at FROM cache WHERE key = ?", ("text",)).fetchone()[0]
+    assert expires_at > time.time() + 6 * 24 * 3600
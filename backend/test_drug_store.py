@@ -0,0 +1,45 @@
+import asyncio
+
+from drug_store import DrugInfoStore, normalize_drug_name
+
+
+def info(name, purpose):
+    return {"name": name, "purpose": purpose, "health_tips": [f"Tip for {name}"], "food_interactions": []}
+
+
+def test_positional_fallback_never_overwrites_a_known_drug():
+    store = DrugInfoStore("v1")
+    store.drugs.set(normalize_drug_name("Crocin"), info("Crocin", "Relieves fever."))
+
+    async def generate(new_drugs, known_drugs):
+        # The model describes the known drug again instead of echoing the new one.
+        return {"drugs": [info("Crocin", "Something else."), info("Pantocid Tablet", "Reduces acid.")],
+                "summary": "Fever and acidity."}
+
+    result = asyncio.run(store.summarize(["Crocin 650", "Pantocid 40"], generate))
+    assert store.get("Crocin")["purpose"] == "Relieves fever."
+    assert store.get("Pantocid")["purpose"] == "Reduces acid."
+    assert result["summary"] == "Fever and acidity."
+
+
+def test_positional_fallback_fills_a_misnamed_new_drug():
+    store = DrugInfoStore("v1")
+
+    async def generate(new_drugs, known_drugs):
+        return {"drugs": [info("Pan-D", "Reduces acid.")], "summary": ""}
+
+    asyncio.run(store.summarize(["Pantocid DSR"], generate))
+    assert store.get("Pantocid DSR")["purpose"] == "Reduces acid."
+
+
+def test_lookup_sends_known_drugs_before_the_summary_is_generated():
+    store = DrugInfoStore("v1")
+    store.drugs.set(normalize_drug_name("Crocin"), info("Crocin", "Relieves fever."))
+
+    parts = store.lookup(["Crocin 650", "Pantocid 40"])
+    assert parts.unseen == ["Pantocid 40"] and parts.known == {"Crocin 650": "Relieves fever."}
+    assert store.sections(parts) == {"summary": "", "health_tips": ["Tip for Crocin"], "food_interactions": []}
+
+    store.learn_drugs(parts, [info("Pantocid 40", "Reduces acid.")])
+    store.learn_summary(parts, "Fever and acidity.")
+    assert parts.complete and store.lookup(["Pantocid 40", "Crocin 650"]).complete
@@ -0,0 +1,73 @@
+import pytest
+
+from rule_extractor import GUESSED, RuleExtractor
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return RuleExtractor()
+
+
+def test_routine_prescription_is_read_locally(extractor):
+    result = extractor.extract("Rx\nTab. Crocin 650 1 tab 1-0-1 after food x 5 days\nAdvice: Review after 5 days")
+    assert result.is_confident()
+    assert result.medications == [{
+        "name": "Crocin 650 Tablet", "dosage": "1 tablet",
+        "instruction": "Take after food, twice daily (morning and night) for 5 days", "duration_days": 5,
+    }]
+
+
+def test_unknown_first_drug_after_rx_goes_to_the_model(extractor):
+    result = extractor.extract("Rx\n1) Cilacar 10 1-0-0 x 30 days\n2) Tab Telma 40 0-0-1 x 30 days")
+    assert not result.is_confident()
+    assert "1) Cilacar 10 1-0-0 x 30 days" in result.uncertain_lines
+
+
+def test_unknown_first_drug_without_rx_is_not_letterhead(extractor):
+    result = extractor.extract("Dr. A. Kumar MBBS\nCilacar 10 1-0-0 x 30 days\nTab Telma 40 0-0-1 x 30 days")
+    assert not result.is_confident()
+    assert result.uncertain_lines == ["Cilacar 10 1-0-0 x 30 days"]
+
+
+def test_fraction_is_the_dose_not_the_strength(extractor):
+    medication = extractor.extract("Tab Montair LC 1/2 tab HS x 5 days").medications[0]
+    assert medication["name"] == "Montair LC Tablet"
+    assert medication["dosage"] == "½ tablet"
+
+
+def test_hyphenated_suffix_stays_in_the_name(extractor):
+    assert extractor.extract("Tab Zerodol-SP 1-0-1 after food x 5 days").medications[0]["name"] == "Zerodol-SP Tablet"
+
+
+def test_low_confidence_token_is_guessed(extractor):
+    result = extractor.extract("Tab Crocin 650 [?1-0-1] x 5 days")
+    assert result.confidences[0]["instruction"] == GUESSED
+    assert result.confidences[0]["dosage"] == GUESSED
+    assert not result.is_confident()
+
+
+def test_review_advice_keeps_the_whole_line(extractor):
+    result = extractor.extract("Tab Crocin 650 1-0-1 x 5 days\nReview with reports in 7 days\nAdv: Plenty of fluids")
+    assert result.advice == "Review with reports in 7 days Plenty of fluids"
+
+
+@pytest.mark.parametrize("text", [
+    "Rx\nTab Wysolone 40 1-0-0 x 5 days then 0-0-1 x 5 days",
+    "Tab Crocin 650 1-0-1 x 5 days alternate days",
+    "Tab Crocin 650 1-0-1 SOS x 5 days",
+    "Tab Crocin 650 1-0-1 x 5 days\n0-0-1 x 3 days",
+])
+def test_unread_words_send_the_line_to_the_model(extractor, text):
+    result = extractor.extract(text)
+    assert not result.is_confident()
+    assert result.confidences[0]["instruction"] == GUESSED
+    assert text.splitlines()[-1] in result.uncertain_lines
+
+
+@pytest.mark.parametrize("text", [
+    "Tab Crocin 650 1-0-1 BD after food x 5 days",
+    "Syp. Benadryl 10 ml TDS x 3 days",
+    "Tab Crocin 650\n1-0-1 after food\nx 5 days",
+])
+def test_repeated_or_filler_words_stay_local(extractor, text):
+    assert extractor.extract(text).is_confident()
@@ -0,0 +1,105 @@
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cache import SQLiteCache, TieredCache, sha256_hex
+
+
+# Values the translation prompt has always told the model to leave alone.
+UNTRANSLATED_VALUES = {"N/A", "Illegible"}
+# Drug names are kept as written on the prescription.
+UNTRANSLATED_KEYS = {"name"}
+# Strings with no letters at all (doses like "1-0-1", times, numbers) need no translation.
+_NO_LETTERS = re.compile(r"^[\W\d_]*$")
+
+TranslateBatch = Callable[[List[str], str], Awaitable[List[str]]]
+
+
+def needs_translation(key: Optional[str], value: Any) -> bool:
+    if not isinstance(value, str) or key in UNTRANSLATED_KEYS:
+        return False
+    stripped = value.strip()
+    return bool(stripped) and stripped not in UNTRANSLATED_VALUES and not _NO_LETTERS.match(stripped)
+
+
+def collect_strings(node: Any, key: Optional[str] = None, found: Optional[Dict[str, None]] = None) -> List[str]:
+    """Walks a JSON tree and returns its distinct translatable strings, in first-seen order."""
+    found = {} if found is None else found
+    if isinstance(node, dict):
+        for child_key, child in node.items():
+            collect_strings(child, child_key, found)
+    elif isinstance(node, list):
+        for child in node:
+            collect_strings(child, key, found)
+    elif needs_translation(key, node):
+        found[node] = None
+    return list(found)
+
+
+def apply_translations(node: Any, translations: Dict[str, str], key: Optional[str] = None) -> Any:
+    """Returns a copy of the JSON tree with every translatable string replaced."""
+    if isinstance(node, dict):
+        return {child_key: apply_translations(child, translations, child_key) for child_key, child in node.items()}
+    if isinstance(node, list):
+        return [apply_translations(child, translations, key) for child in node]
+    if needs_translation(key, node):
+        return translations.get(node, node)
+    return node
+
+
+class TranslationMemory:
+    """Remembers translations per (source string, target language).
+
+    Only strings that were never translated into a language before are sent to the
+    model, as one batch per language; everything else is served locally.
+    """
+
+    def __init__(self, version: str, disk: Optional[SQLiteCache] = None, maxsize: int = 20000):
+        self.entries = TieredCache("translation", version, disk, maxsize=maxsize, ttl=7 * 24 * 3600)
+        self.strings_served = 0
+        self.strings_translated = 0
+        self.batches = 0
+
+    @staticmethod
+    def _key(text: str, language: str) -> str:
+        return f"{sha256_hex(text)}:{language.strip().lower()}"
+
+    async def _translate_strings(self, strings: List[str], language: str, translate_batch: TranslateBatch) -> Dict[str, str]:
+        translations, missing = {}, []
+        for text in strings:
+            cached = self.entries.get(self._key(text, language))
+            if cached is None:
+                missing.append(text)
+            else:
+                translations[text] = cached
+        self.strings_served += len(translations)
+
+        if missing:
+            translated = await translate_batch(missing, language)
+            if len(translated) != len(missing):
+                raise ValueError(f"Expected {len(missing)} translations, got {len(translated)}.")
+            self.batches += 1
+            self.strings_translated += len(missing)
+            for source, target in zip(missing, translated):
+                translations[source] = target
+                self.entries.set(self._key(source, language), target)
+        return translations
+
+    async def translate(self, content: Any, languages: List[str], translate_batch: TranslateBatch) -> Dict[str, Any]:
+        """Translates `content` into each language; returns {language: translated content}."""
+        strings = collect_strings(content)
+        per_language = await asyncio.gather(
+            *(self._translate_strings(strings, language, translate_batch) for language in languages)
+        )
+        return {
+            language: apply_translations(content, translations)
+            for language, translations in zip(languages, per_language)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "strings_served": self.strings_served,
+            "strings_translated": self.strings_translated,
+            "batches": self.batches,
+            "entries": self.entries.stats(),
+        }